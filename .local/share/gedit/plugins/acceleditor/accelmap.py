@@ -23,6 +23,13 @@ import os
 
 from gettext import gettext as _
 
+try:
+    from hackslib.profiler import profiled
+except ImportError:
+    # the accelerator editor does not need hackslib, only profiling does
+    def profiled(func):
+        return func
+
 ui_str = """
 <ui>
   <menubar name="MenuBar">
@@ -35,6 +42,103 @@ ui_str = """
 </ui>
 """
 
+# accel path -> (group, action), or None for wrongly formatted paths.
+# Paths never change meaning, so each one is parsed once per gedit process.
+_accel_path_index = {}
+
+def parse_accel_path(accel_path):
+    if not accel_path in _accel_path_index:
+        regex = re.match("^<Actions>/(.+)/(.+)$", accel_path)
+        _accel_path_index[accel_path] = regex.groups() if regex else None
+    return _accel_path_index[accel_path]
+
+def binding(key, mods):
+    return (key, int(mods) & int(Gtk.accelerator_get_default_mod_mask()))
+
+class AccelIndex(object):
+    """ Reverse index from (key, mods) to the accel paths using that binding """
+
+    def __init__(self):
+        self.paths = {}
+        self.bindings = {}
+        Gtk.AccelMap.foreach(None, self.on_accel)
+        Gtk.AccelMap.get().connect('changed', self.on_changed)
+
+    def on_accel(self, data, accel_path, accel_key, accel_mods, changed):
+        self.update(accel_path, accel_key, accel_mods)
+
+    def on_changed(self, accel_map, accel_path, accel_key, accel_mods):
+        self.update(accel_path, accel_key, accel_mods)
+
+    def update(self, accel_path, accel_key, accel_mods):
+        old = self.paths.pop(accel_path, None)
+        if old in self.bindings:
+            self.bindings[old].discard(accel_path)
+            if not self.bindings[old]:
+                del self.bindings[old]
+
+        if accel_key:
+            new = binding(accel_key, accel_mods)
+            self.paths[accel_path] = new
+            self.bindings.setdefault(new, set()).add(accel_path)
+
+    def conflicts(self, accel_path, accel_key, accel_mods):
+        """ Other accel paths already bound to the given key and mods """
+        if not accel_key:
+            return []
+        paths = self.bindings.get(binding(accel_key, accel_mods), ())
+        return sorted(path for path in paths if path != accel_path)
+
+_accel_index = None
+
+def get_accel_index():
+    """ The process wide AccelIndex, built on first use """
+    global _accel_index
+    if _accel_index is None:
+        _accel_index = AccelIndex()
+    return _accel_index
+
+PROFILE_HEADER = '# gedit shortcut profile: accel path <TAB> accelerator\n'
+
+def export_profile(filename):
+    """ Write the bindings changed from their defaults, one sorted line each """
+    lines = []
+
+    def collect(data, accel_path, accel_key, accel_mods, changed):
+        if changed:
+            lines.append('%s\t%s\n' % (accel_path, Gtk.accelerator_name(accel_key, accel_mods)))
+
+    Gtk.AccelMap.foreach(None, collect)
+    lines.sort()
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(PROFILE_HEADER)
+        f.writelines(lines)
+    return len(lines)
+
+def read_profile(filename):
+    """ List of (accel path, key, mods) in a profile, skipping bad lines """
+    entries = []
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            accel_path, sep, name = line.partition('\t')
+            if not sep or not parse_accel_path(accel_path):
+                continue
+            accel_key, accel_mods = Gtk.accelerator_parse(name)
+            if name and not accel_key:
+                # unparsable, applying it would clear the shortcut
+                continue
+            entries.append((accel_path, accel_key, accel_mods))
+    return entries
+
+def apply_profile(entries):
+    for accel_path, accel_key, accel_mods in entries:
+        if not Gtk.AccelMap.change_entry(accel_path, accel_key, accel_mods, True):
+            # actions of plugins not loaded yet get it when they register
+            Gtk.AccelMap.add_entry(accel_path, accel_key, accel_mods)
+
 class KeyVal(GObject.Object):
     __gtype_name__ = "GeditAccelEditorKeyVal"
 
@@ -43,6 +147,7 @@ class KeyVal(GObject.Object):
         self.accel_path = accel_path
         self.key = key
         self.mods = mods
+        self.label = None
 
     def get_accel_path(self):
         return self.accel_path
@@ -52,12 +157,19 @@ class KeyVal(GObject.Object):
 
     def set_key(self, key):
         self.key = key
+        self.label = None
 
     def get_mods(self):
         return self.mods
 
     def set_mods(self, mods):
         self.mods = mods
+        self.label = None
+
+    def get_label(self):
+        if self.label is None:
+            self.label = Gtk.accelerator_get_label(self.key, self.mods)
+        return self.label
 
 class AccelEditor(Gtk.Dialog, Gtk.Buildable):
     __gtype_name__ = "GeditAccelEditorDialog"
@@ -69,6 +181,13 @@ class AccelEditor(Gtk.Dialog, Gtk.Buildable):
         Gtk.Dialog.__init__(self)
         self.model = None
         self.treeview = None
+        self.groups = {}
+        self.keyvals = {}
+        self.accel_index = None
+        self.accel_map_handler = None
+        self.batch_update = False
+        self.filter_text = ''
+        self.filter_matches = None
 
     def __getitem__(self, key):
         return self.builder.get_object(key)
@@ -82,11 +201,41 @@ class AccelEditor(Gtk.Dialog, Gtk.Buildable):
             cell.set_property('visible', True)
             cell.set_property('accel-key', keyval.get_key())
             cell.set_property('accel-mods', keyval.get_mods())
+            # bindings shared with other actions are shown in red
+            conflicts = self.accel_index.conflicts(keyval.get_accel_path(), keyval.get_key(), keyval.get_mods())
+            cell.set_property('foreground-set', len(conflicts) > 0)
+            if conflicts:
+                cell.set_property('foreground', 'red')
+
+    def confirm_conflicts(self, label, conflicts):
+        names = []
+        for accel_path in conflicts:
+            parsed = parse_accel_path(accel_path)
+            names.append('%s (%s)' % (parsed[1], parsed[0]) if parsed else accel_path)
+
+        dlg = Gtk.MessageDialog(self, Gtk.DialogFlags.MODAL | Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                                Gtk.MessageType.WARNING, Gtk.ButtonsType.YES_NO,
+                                _('%s is already used by:') % label)
+        dlg.format_secondary_text('\n'.join(names) + '\n\n' + _('Assign it anyway? They will lose it.'))
+        resp = dlg.run()
+        dlg.destroy()
+        return resp == Gtk.ResponseType.YES
+
+    def show_error(self, title, message):
+        dlg = Gtk.MessageDialog(self, Gtk.DialogFlags.MODAL | Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                                Gtk.MessageType.ERROR, Gtk.ButtonsType.CLOSE, title)
+        dlg.format_secondary_text(message)
+        dlg.run()
+        dlg.destroy()
 
     def change_keyval(self, path_str, accel_key, accel_mods):
         it = self.model.get_iter_from_string(path_str)
 
         keyval = self.model.get_value(it, self.SHORTCUT_COLUMN)
+        conflicts = self.accel_index.conflicts(keyval.get_accel_path(), accel_key, accel_mods)
+        if conflicts and not self.confirm_conflicts(Gtk.accelerator_get_label(accel_key, accel_mods), conflicts):
+            return
+
         keyval.set_key(accel_key)
         keyval.set_mods(accel_mods)
 
@@ -100,19 +249,134 @@ class AccelEditor(Gtk.Dialog, Gtk.Buildable):
     def on_accel_edited(self, accel, path_str, accel_key, accel_mods, hw_keycode):
         self.change_keyval(path_str, accel_key, accel_mods)
 
-    def populate_treeview(self, data, accel_path, accel_key, accel_mods, changed):
-        regex = re.match("^<Actions>/(.+)/(.+)$", accel_path)
-        if not regex:
+    def collect_accel(self, data, accel_path, accel_key, accel_mods, changed):
+        parsed = parse_accel_path(accel_path)
+        if not parsed:
             #skip wrongly formatted actions
             return
 
-        group, action = regex.group(1), regex.group(2)
+        group, action = parsed
+        if not group in self.groups:
+            self.groups[group] = []
+        keyval = KeyVal(accel_path, accel_key, accel_mods)
+        self.groups[group].append((action, keyval))
+        self.keyvals[accel_path] = keyval
+        # entries added after the index was built are picked up here
+        self.accel_index.update(accel_path, accel_key, accel_mods)
+
+    def on_accel_map_changed(self, accel_map, accel_path, accel_key, accel_mods):
+        # other actions lose their binding when it is reassigned
+        keyval = self.keyvals.get(accel_path)
+        if keyval and (keyval.get_key(), keyval.get_mods()) != (accel_key, accel_mods):
+            keyval.set_key(accel_key)
+            keyval.set_mods(accel_mods)
+        if not self.batch_update:
+            self.treeview.queue_draw()
+
+    def match_accel(self, group, action, keyval, text):
+        return text in action.lower() or text in group.lower() or \
+               text in keyval.get_label().lower()
+
+    def filter_groups(self, text):
+        # narrowing the previous filter only needs to look at its matches
+        if self.filter_matches is not None and self.filter_text and text.startswith(self.filter_text):
+            groups = self.filter_matches
+        else:
+            groups = self.groups
+
+        matches = {}
+        for group, accels in groups.items():
+            found = [(action, keyval) for action, keyval in accels
+                     if self.match_accel(group, action, keyval, text)]
+            if found:
+                matches[group] = found
+        return matches
+
+    def populate_treeview(self):
+        text = self.filter_text
+        if text:
+            groups = self.filter_matches
+        else:
+            groups = self.groups
+
+        # detach the model so the view does not follow every row insertion
+        self.treeview.set_model(None)
+        self.model.clear()
+        for group in sorted(groups):
+            it = self.model.append(None, (group, None))
+            if text:
+                for action, keyval in groups[group]:
+                    self.model.append(it, (action, keyval))
+            else:
+                # placeholder, actions are added when the group is expanded
+                self.model.append(it, ('', None))
+        self.treeview.set_model(self.model)
 
-        if not group in self.group_iters:
-            self.group_iters[group] = self.model.append(None, (group, None))
+        if text:
+            self.treeview.expand_all()
 
-        keyval = KeyVal(accel_path, accel_key, accel_mods)
-        self.model.append(self.group_iters[group], (action, keyval))
+    def on_test_expand_row(self, treeview, it, path):
+        child = self.model.iter_children(it)
+        if child is None or self.model.get_value(child, self.SHORTCUT_COLUMN):
+            return False
+
+        group = self.model.get_value(it, self.ACTION_COLUMN)
+        for action, keyval in self.groups[group]:
+            self.model.append(it, (action, keyval))
+        self.model.remove(child)
+        return False
+
+    def on_filter_changed(self, entry):
+        text = entry.get_text().strip().lower()
+        if text:
+            self.filter_matches = self.filter_groups(text)
+        else:
+            self.filter_matches = None
+        self.filter_text = text
+        self.populate_treeview()
+
+    def choose_profile_file(self, title, action, stock_id):
+        dlg = Gtk.FileChooserDialog(title, self, action,
+                                    (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                                     stock_id, Gtk.ResponseType.ACCEPT))
+        dlg.set_do_overwrite_confirmation(True)
+        if action == Gtk.FileChooserAction.SAVE:
+            dlg.set_current_name('shortcuts.profile')
+        filename = None
+        if dlg.run() == Gtk.ResponseType.ACCEPT:
+            filename = dlg.get_filename()
+        dlg.destroy()
+        return filename
+
+    def on_export_clicked(self, button):
+        filename = self.choose_profile_file(_('Export Shortcuts'), Gtk.FileChooserAction.SAVE, Gtk.STOCK_SAVE)
+        if not filename:
+            return
+        try:
+            export_profile(filename)
+        except OSError as e:
+            self.show_error(_('Could not export shortcuts'), str(e))
+
+    def on_import_clicked(self, button):
+        filename = self.choose_profile_file(_('Import Shortcuts'), Gtk.FileChooserAction.OPEN, Gtk.STOCK_OPEN)
+        if not filename:
+            return
+
+        try:
+            entries = read_profile(filename)
+        except (OSError, UnicodeDecodeError) as e:
+            self.show_error(_('Could not import shortcuts'), str(e))
+            return
+
+        # keyvals are updated by the changed signal, the view is refreshed once at the end
+        self.batch_update = True
+        self.treeview.set_model(None)
+        try:
+            apply_profile(entries)
+        finally:
+            self.batch_update = False
+        self.filter_matches = self.filter_groups(self.filter_text) if self.filter_text else None
+        self.populate_treeview()
 
     def do_parser_finished(self, builder):
         self.builder = builder
@@ -125,18 +389,26 @@ class AccelEditor(Gtk.Dialog, Gtk.Buildable):
 
         handlers_dic = {
             'on_accel_edited' : self.on_accel_edited,
-            'on_accel_cleared' : self.on_accel_cleared }
+            'on_accel_cleared' : self.on_accel_cleared,
+            'on_filter_changed' : self.on_filter_changed,
+            'on_export_clicked' : self.on_export_clicked,
+            'on_import_clicked' : self.on_import_clicked }
 
         self.builder.connect_signals(handlers_dic)
+        self.treeview.connect('test-expand-row', self.on_test_expand_row)
 
-        self.group_iters = dict()
-        #add the accels to the treeview
-        Gtk.AccelMap.foreach(None, self.populate_treeview)
-
-        self.treeview.set_model(self.model)
-        self.treeview.expand_all()
+        #collect the accels, groups are only filled in when expanded
+        self.accel_index = get_accel_index()
+        Gtk.AccelMap.foreach(None, self.collect_accel)
+        self.accel_map_handler = Gtk.AccelMap.get().connect('changed', self.on_accel_map_changed)
+        for accels in self.groups.values():
+            accels.sort(key=lambda accel: accel[0])
+        self.populate_treeview()
 
     def do_response(self, resp):
+        if self.accel_map_handler is not None:
+            Gtk.AccelMap.get().disconnect(self.accel_map_handler)
+            self.accel_map_handler = None
         self.destroy()
 
 class AccelPlugin(GObject.Object, Gedit.WindowActivatable):
@@ -148,6 +420,7 @@ class AccelPlugin(GObject.Object, Gedit.WindowActivatable):
         GObject.Object.__init__(self)
         self.dlg = None
 
+    @profiled
     def do_activate(self):
         manager = self.window.get_ui_manager()
 
@@ -172,6 +445,7 @@ class AccelPlugin(GObject.Object, Gedit.WindowActivatable):
     def editor_destroyed(self, dlg):
         self.dlg = None
 
+    @profiled
     def popup_editor(self, action, data=None):
         if not self.dlg:
             builder = Gtk.Builder()
@@ -21,10 +21,16 @@ import os, os.path
 import tempfile
 import time
 import string
-from multiprocessing import Process
+from hackslib import workers, profiler
+from .projectmeta import ProjectMetadataCache
+from .discovery import discover_projects
+from .prewarm import prewarm
 
 app_string = "Fastprojects"
 
+# project path -> window opened for it, shared by every window of this gedit process
+project_windows = {}
+
 def spit( *obj ):
     print(str(obj))
 
@@ -38,6 +44,9 @@ class FastprojectsPluginInstance:
         self._plugin = plugin
         self._dirs = [] # to be filled
         self._tmpfile = os.path.join(tempfile.gettempdir(), 'fastprojects.%s.%s' % (os.getuid(),os.getpid()))
+        # shared by every session, entries are invalidated by .git mtimes
+        self._metafile = os.path.join(tempfile.gettempdir(), 'fastprojects.%s.meta' % os.getuid())
+        self._metadata = ProjectMetadataCache(self._metafile)
         self._show_hidden = False
         self._liststore = None;
         self._init_ui()
@@ -132,6 +141,7 @@ class FastprojectsPluginInstance:
         self.open_selected_item(event)
 
     #keyboard event on entry field
+    @profiler.profiled
     def on_pattern_entry( self, widget, event ):
 
         # quick keys mapping
@@ -158,9 +168,13 @@ class FastprojectsPluginInstance:
         print(cmd)
         hits = os.popen(cmd).readlines()
         spit(hits)
-        for hit in hits:
-            path = hit.replace("\n",'').strip()
+        paths = [hit.replace("\n",'').strip() for hit in hits]
+        # most recently active projects first, metadata is already in memory
+        for path in self._metadata.sort_by_activity(paths):
             name = path.split('/')[-1]
+            branch = self._metadata.branch(path)
+            if branch:
+                name = "%s [%s]" % (name, branch)
             item = [name,path]
             self._liststore.append(item)
 
@@ -185,28 +199,35 @@ class FastprojectsPluginInstance:
     #on menuitem activation (incl. shortcut)
     def on_fastprojects_file_action( self ):
         self._init_ui()
+        self._metadata.load()
         self._fastprojects_window.show()
 
     def calculate_project_paths( self, notify = False ):
+        """ Walks home for projects on a worker, every window shares one walk """
+        callback = self.on_project_paths
         if notify:
-          self._glade_entry_name.set_text('Calculating paths...')
-          while Gtk.events_pending():
-            Gtk.main_iteration()
-        # build paths list
-        f = open(self._tmpfile,'w')
-        try:
-            # find .git folders within configured paths
-            for dirname, dirnames, filenames in os.walk(os.path.expanduser("~"), followlinks=True):
-                if '.git' in dirnames:
-                    f.write(dirname + '\n')
-                # remove hidden folders
-                hidden = [d for d in dirnames if d.startswith('.')]
-                for d in hidden:
-                    dirnames.remove(d)
-        finally:
-            f.close()
-            self._glade_entry_name.set_text('')
-            self._glade_entry_name.grab_focus()
+            self._glade_entry_name.set_text('Calculating paths...')
+            callback = self.on_project_paths_refreshed
+        job = workers.get_pool().submit(discover_projects, self._tmpfile, self._metafile,
+                                        key='fastprojects:' + self._tmpfile,
+                                        callback=callback)
+        if job.rejected:
+            # too much background work queued, keep the current list
+            self.status('Fastprojects: busy, project list not refreshed')
+            if notify:
+                self._glade_entry_name.set_text('')
+
+    def on_project_paths( self, projects ):
+        if self._window is None:
+            return
+        self._metadata.load()
+
+    def on_project_paths_refreshed( self, projects ):
+        if self._window is None:
+            return
+        self._metadata.load()
+        self._glade_entry_name.set_text('')
+        self._glade_entry_name.grab_focus()
 
 
     #on any keyboard event in main window
@@ -225,14 +246,35 @@ class FastprojectsPluginInstance:
             self.open_project(item)
         self._fastprojects_window.hide()
 
+    def get_project_window( self, path ):
+        """ Window already opened for given project, None if it was closed """
+        window = project_windows.get(path)
+        if window is not None and window in Gedit.App.get_default().get_windows():
+            return window
+        project_windows.pop(path, None)
+        return None
+
+    def forget_project_window( self, window, path ):
+        if project_windows.get(path) is window:
+            del project_windows[path]
+
     def open_project( self, path ):
         spit('open '+ path)
+        # ya abierto, solo traerlo al frente
+        window = self.get_project_window(path)
+        if window is not None:
+            window.present()
+            return
         # abrir nueva ventana
         window = Gedit.App.get_default().create_window(None)
+        project_windows[path] = window
+        window.connect('destroy', self.forget_project_window, path)
         window.show()
         # cambiar root del filebrowser
         location = Gio.File.new_for_path(path)
         send_message(window, '/plugins/filebrowser', 'set_root', location=location)
+        # list and read the project in the background, so first searches hit warm data
+        workers.get_pool().submit(prewarm, path, key='prewarm:' + path)
 
 # STANDARD PLUMMING
 class FastprojectsPlugin(GObject.Object, Gedit.WindowActivatable):
@@ -250,11 +292,11 @@ class FastprojectsPlugin(GObject.Object, Gedit.WindowActivatable):
     def _set_instance( self, instance ):
         self.window.DATA_TAG = instance
 
+    @profiler.profiled
     def do_activate( self ):
         instance = FastprojectsPluginInstance( self, self.window )
         self._set_instance( instance )
-        p = Process(target=instance.calculate_project_paths)
-        p.start()
+        instance.calculate_project_paths()
 
     def do_deactivate( self ):
         if self._get_instance():
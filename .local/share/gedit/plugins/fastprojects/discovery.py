@@ -0,0 +1,43 @@
+# -*- coding: utf8 -*-
+#  Fastprojects plugin for gedit
+#
+#  Copyright (C) 2012-2013 Rubén Caro
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Finding git projects under the home dir, meant to run on a worker """
+
+import os, os.path
+from hackslib.projectroots import find_projects
+from .projectmeta import ProjectMetadataCache
+
+def discover_projects( listfile, metafile, job = None ):
+    """ Writes the project list to listfile and refreshes the metadata cache in metafile """
+    projects = []
+    tmp = listfile + '.new'
+    with open(tmp, 'w', errors='surrogateescape') as f:
+        for project in find_projects(os.path.expanduser("~"), job):
+            f.write(project + '\n')
+            projects.append(project)
+    if job is not None and job.cancelled:
+        os.remove(tmp)
+        return projects
+    os.replace(tmp, listfile)
+
+    # gather branch, activity and size for ranking, reusing unchanged entries
+    metadata = ProjectMetadataCache(metafile)
+    metadata.load()
+    metadata.refresh(projects)
+    metadata.save()
+    return projects
@@ -0,0 +1,60 @@
+# -*- coding: utf8 -*-
+#  Fastprojects plugin for gedit
+#
+#  Copyright (C) 2012-2013 Rubén Caro
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Background warm-up of a project right after it is opened """
+
+import os, os.path
+from hackslib.projectroots import project_index_file
+from hackslib.search import list_files
+
+# files bigger than this are not worth pulling into the page cache
+max_warm_size = 256 * 1024
+block_size = 4096
+
+def warm_file( path ):
+    """ Reads a small text file so the next grep finds it in the page cache """
+    try:
+        if os.path.getsize(path) > max_warm_size:
+            return False
+        with open(path, 'rb') as f:
+            if b'\0' in f.read(block_size):
+                # binary, grep -I would skip it anyway
+                return False
+            while f.read(block_size * 16):
+                pass
+    except OSError:
+        return False
+    return True
+
+def prewarm( root, job = None ):
+    """ Builds the file index for root and warms the page cache. Meant to run on a background worker. """
+    target = project_index_file(root)
+    tmp = '%s.%s.tmp' % (target, os.getpid())
+    files = []
+    with open(tmp, 'w', errors='surrogateescape') as f:
+        for path in list_files(root, job):
+            f.write(path + '\n')
+            files.append(path)
+    if job is not None and job.cancelled:
+        os.remove(tmp)
+        return
+    os.replace(tmp, target)
+    for path in files:
+        if job is not None and job.cancelled:
+            return
+        warm_file(path)
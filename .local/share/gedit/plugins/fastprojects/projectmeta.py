@@ -0,0 +1,162 @@
+# -*- coding: utf8 -*-
+#  Fastprojects plugin for gedit
+#
+#  Copyright (C) 2012-2013 Rubén Caro
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Project metadata (branch, last activity, size) read straight from .git """
+
+import os, os.path
+import json
+
+def mtime( path ):
+    """ mtime of given path, 0 if it does not exist """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0
+
+def get_git_dir( project ):
+    """ Path to the git dir of the project, following 'gitdir:' files """
+    gitdir = os.path.join(project, '.git')
+    if os.path.isfile(gitdir):
+        # worktrees and submodules point to the real git dir
+        try:
+            with open(gitdir) as f:
+                line = f.readline().strip()
+        except (OSError, UnicodeDecodeError):
+            return None
+        if not line.startswith('gitdir:'):
+            return None
+        gitdir = os.path.join(project, line[len('gitdir:'):].strip())
+    if os.path.isdir(gitdir):
+        return os.path.normpath(gitdir)
+    return None
+
+def read_head( gitdir ):
+    """ Returns (branch, ref file) for HEAD. Detached HEADs give a short sha. """
+    try:
+        with open(os.path.join(gitdir, 'HEAD')) as f:
+            head = f.readline().strip()
+    except (OSError, UnicodeDecodeError):
+        return None, None
+    if head.startswith('ref:'):
+        ref = head[len('ref:'):].strip()
+        return ref.replace('refs/heads/', '', 1), os.path.join(gitdir, ref)
+    return head[:7], None
+
+def signature( gitdir ):
+    """ mtimes that change whenever there is activity on the repo """
+    ref_file = read_head(gitdir)[1]
+    paths = ['HEAD', 'index', 'packed-refs', os.path.join('logs', 'HEAD')]
+    stamps = [mtime(os.path.join(gitdir, p)) for p in paths]
+    if ref_file:
+        stamps.append(mtime(ref_file))
+    return stamps
+
+def approximate_size( gitdir ):
+    """ Bytes in the index and object packs, a cheap hint of the project size """
+    size = 0
+    try:
+        size += os.stat(os.path.join(gitdir, 'index')).st_size
+    except OSError:
+        pass
+    packdir = os.path.join(gitdir, 'objects', 'pack')
+    try:
+        with os.scandir(packdir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.pack'):
+                    size += entry.stat().st_size
+    except OSError:
+        pass
+    return size
+
+def collect( project, gitdir = None, stamps = None ):
+    """ Reads metadata for one project. None if it is not a git repo.
+    gitdir and its signature are looked up unless already known. """
+    if gitdir is None:
+        gitdir = get_git_dir(project)
+        if gitdir is None:
+            return None
+    if stamps is None:
+        stamps = signature(gitdir)
+    branch = read_head(gitdir)[0]
+    return { 'signature': stamps,
+             'branch': branch or '',
+             'last_activity': max(stamps),
+             'size': approximate_size(gitdir) }
+
+class ProjectMetadataCache:
+    """ Metadata per project path, persisted as json and invalidated by mtime """
+
+    def __init__( self, filename ):
+        self._filename = filename
+        self._entries = {}
+        self._loaded_mtime = None
+
+    def load( self ):
+        """ (Re)load the cache file, only if it changed since last load """
+        current = mtime(self._filename)
+        if current == self._loaded_mtime:
+            return
+        try:
+            with open(self._filename) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        self._entries = entries if isinstance(entries, dict) else {}
+        self._loaded_mtime = current
+
+    def save( self ):
+        """ Atomically replace the cache file """
+        tmp = '%s.%s.tmp' % (self._filename, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self._filename)
+        self._loaded_mtime = mtime(self._filename)
+
+    def refresh( self, projects ):
+        """ Update entries for given projects, reusing the ones whose mtimes did not change """
+        entries = {}
+        for project in projects:
+            old = self._entries.get(project)
+            gitdir = get_git_dir(project)
+            if gitdir is None:
+                continue
+            stamps = signature(gitdir)
+            if old is not None and old.get('signature') == stamps:
+                entries[project] = old
+                continue
+            entries[project] = collect(project, gitdir, stamps)
+        self._entries = entries
+
+    def get( self, project ):
+        return self._entries.get(project)
+
+    def last_activity( self, project ):
+        meta = self._entries.get(project)
+        if meta is None:
+            return 0
+        return meta.get('last_activity', 0)
+
+    def branch( self, project ):
+        meta = self._entries.get(project)
+        if meta is None:
+            return ''
+        return meta.get('branch', '')
+
+    def sort_by_activity( self, projects ):
+        """ Most recently active projects first, by name on ties """
+        return sorted(projects, key=lambda p: (-self.last_activity(p), p))
@@ -18,10 +18,10 @@
 
 from gi.repository import GObject, Gedit, Gtk, Gio, Gdk, GLib
 import os, os.path
-import tempfile
+import re
 import time
 import string
-from subprocess import Popen, PIPE, STDOUT
+from hackslib import projectroots, workers, profiler, search, query
 
 max_result = 1000
 app_string = "Grepint"
@@ -38,17 +38,15 @@ class GrepintPluginInstance:
         self._window = window
         self._plugin = plugin
         self._dirs = [] # to be filled
-        glob_excludes = ['*.log','*~','*.swp']
-        dir_excludes = ['.git','.svn','log']
-        self._excludes = '--exclude=' + ' --exclude='.join(glob_excludes)
-        self._excludes += ' --exclude-dir=' + ' --exclude-dir='.join(dir_excludes)
         self._show_hidden = False
         self._liststore = None;
         self._init_ui()
         self._insert_menu()
         self._single_file_grep = True
+        self._search_job = None
 
     def deactivate( self ):
+        self.cancel_search()
         self._remove_menu()
         self._action_group = None
         self._window = None
@@ -146,6 +144,8 @@ class GrepintPluginInstance:
         self._use_rvm = self._builder.get_object("check_rvm").get_active
         self._action_rvm = self._builder.get_object("action_rvm")
         self._custom_folder = self._builder.get_object("custom_folder")
+        self._mode_combo = self._builder.get_object("mode_combo")
+        self._mode_combo.connect("changed", lambda a: self.perform_search())
 
     #mouse event on list
     def on_list_mouse( self, widget, event ):
@@ -162,6 +162,7 @@ class GrepintPluginInstance:
         self._grepint_window.set_title("Searching ... ")
 
     # keyboard event on entry field
+    @profiler.profiled
     def on_pattern_entry( self, widget, event ):
         # quick keys mapping
         if (event != None):
@@ -181,8 +182,6 @@ class GrepintPluginInstance:
             self.calculate_project_paths()
 
         pattern = self._glade_entry_name.get_text()
-        pattern = pattern.replace(" ",".*")
-        cmd = ""
         if self._show_hidden:
             filefilter = ""
 
@@ -190,29 +189,49 @@ class GrepintPluginInstance:
 
         if self._single_file_grep:
             if len(pattern) > 0:
-                cmd = "grep -inH -e \"%s\" '%s' | head -n%d 2> /dev/null" % (pattern, self._current_file, max_result)
+                paths = [self._current_file]
             else:
                 self._grepint_window.set_title("Enter pattern ... ")
                 return
         else:
             if len(pattern) > 2:
-                cmd = "grep -inHRI -D skip %s -e \"%s\" %s | head -n%d 2> /dev/null" % (self._excludes, pattern, self.get_dirs_string(), max_result)
+                paths = sorted(self._dirs)
             else:
                 self._grepint_window.set_title("Enter pattern (3 chars min)... ")
                 return
-        self.show_searching()
-        GLib.idle_add(self.do_search,cmd)
 
-    def do_search( self, cmd ):
+        # plain text skips the regex engine, regexes are prefiltered by their longest literal
+        try:
+            plan = query.plan_query(pattern, self._mode_combo.get_active_id() or query.AUTO)
+        except re.error as e:
+            self.cancel_search()
+            self._grepint_window.set_title("Invalid regex: %s" % e)
+            return
+        self.show_searching()
+        self.cancel_search()
+        info = "%s in %s" % (plan.describe(), projectroots.get_dirs_string(paths))
+        print(info)
+        self._label_info.set_text(info)
+        # the search runs on a worker, a newer search drops this one. grep is faster on
+        # projects, a single file is quicker searched here than by starting grep
+        engine = search.search_paths if self._single_file_grep else search.grep_paths
+        self._search_job = workers.get_pool().submit(engine, plan, paths, max_result,
+                                                     priority=workers.INTERACTIVE,
+                                                     callback=self.show_hits)
+
+    def cancel_search( self ):
+        if self._search_job is not None:
+            self._search_job.cancel()
+            self._search_job = None
+
+    def show_hits( self, hits ):
+        """ Fills the list with (path, line, text) hits, on the main loop """
+        self._search_job = None
+        if self._liststore is None:
+            return False
         self._liststore.clear()
         maxcount = 0
-        print(cmd)
-        self._label_info.set_text(cmd)
-        hits = self.run(cmd)
-        for hit in hits:
-            parts = hit.split(':')
-            path,line = parts[0:2]
-            text = ':'.join(parts[2:])[:160].replace("\n",'').strip()
+        for path, line, text in hits:
             name = os.path.basename(path)
             # TODO: center text on hit using regex pattern
             item = []
@@ -241,32 +260,6 @@ class GrepintPluginInstance:
 
         return False
 
-    def get_git_base_dir( self, path ):
-        """ Get git base dir if given path is inside a git repo. None otherwise. """
-        try:
-            cmd = "cd '%s'; git rev-parse --show-toplevel 2> /dev/null" % path
-            print(cmd)
-            gitdir = self.run(cmd)
-        except:
-            gitdir = ''
-        if len(gitdir) > 0:
-            return gitdir[0].replace("\n","")
-        return None
-
-    def map_to_git_base_dirs( self ):
-        """ Replace paths with respective git repo base dirs if it exists """
-        # use git repo base dir is more suitable if we are inside a git repo, for any dir we have guessed before
-        dirs = []
-        for d in self._dirs:
-            gitdir = self.get_git_base_dir(d)
-            if gitdir is None:
-                dirs.append(d)
-            else:
-                dirs.append(gitdir)
-        self._dirs = set(dirs)
-        # we could have introduced duplicates here
-        self.ensure_unique_entries()
-
     def add_rvm_gemset_dirs( self ):
         """ Append every rvm gemset dir detected for current dir list """
         gemsets = []
@@ -274,50 +267,13 @@ class GrepintPluginInstance:
             cmd = "/bin/bash -l -c 'source $HOME/.rvm/scripts/rvm &> /dev/null; cd '%s' &> /dev/null; gem env gemdir'" % d
             print(cmd)
             try:
-                gemset = self.run(cmd)
+                gemset = search.run_lines(cmd)
             except:
                 gemset = ''
             if len(gemset) > 0:
                 gemsets.append( gemset[0].replace("\n","") )
         self._dirs.update(gemsets)
 
-    def ensure_unique_entries( self ):
-        """ Remove duplicates from dirs list """
-        # this also looks for paths already included in other paths
-        unique = []
-        for d in self._dirs:
-            d = d.replace("file://","").replace("//","/")
-            should_append = True
-            for i,u in enumerate(unique): # replace everyone with its wider parent
-                if u in d: # already this one, or a parent
-                    should_append = False
-                elif d in u: # replace with the parent
-                    unique[i] = d
-                    should_append = False
-
-            if should_append:
-                unique.append(d)
-
-        self._dirs = set(unique)
-
-    def get_dirs_string( self ):
-        """ Gets the quoted string built with dir list, ready to be passed on to 'find' """
-        string = ''
-        for d in self._dirs:
-            string += "'%s' " % d
-        return string
-
-    def run(self, cmd):
-        """ Gets the output lines of the given cmd filtering lines with encoding problems """
-        p = Popen(cmd, shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True)
-        cs = []
-        for s in p.stdout.readlines():
-          try:
-              cs.append( str(s, encoding='utf-8') )
-          except:
-              pass
-        return cs
-
     def status( self,msg ):
         statusbar = self._window.get_statusbar()
         statusbar_ctxtid = statusbar.get_context_id('Grepint')
@@ -385,13 +341,12 @@ class GrepintPluginInstance:
           if fbroot != "" and fbroot is not None:
               self._dirs.add(fbroot)
 
-        # ensure_unique_entries is executed after mapping to git base dir
-        # but it's cheaper, then do it before too, avoiding extra work
-        self.ensure_unique_entries()
+        # remove duplicates and paths already included in other paths
+        self._dirs = set(projectroots.collapse_nested(self._dirs))
 
         # replace each path with its git base dir if exists
         if self._use_git():
-            self.map_to_git_base_dirs()
+            self._dirs = set(projectroots.map_to_git_base_dirs(self._dirs))
 
         # add every rvm gemset associated with each dir we got
         if self._use_rvm():
@@ -489,6 +444,7 @@ class GrepintPlugin(GObject.Object, Gedit.WindowActivatable):
     def _set_instance( self, instance ):
         self.window.DATA_TAG = instance
 
+    @profiler.profiled
     def do_activate( self ):
         self._set_instance( GrepintPluginInstance( self, self.window ) )
 
@@ -0,0 +1,210 @@
+# -*- coding: utf8 -*-
+#  Code shared by the gedit hacks plugins
+#
+#  Copyright (C) 2012-2013 Rubén Caro
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Opt-in profiling of plugin activations and signal handlers.
+
+Start gedit with GEDIT_HACKS_PROFILE=1 (or the dir to write to) and every
+method decorated with @profiled records its wall time, memory allocated
+(tracemalloc) and subprocesses spawned while it runs, or later by the worker
+jobs it submitted. The report for the
+session is written to gedit-hacks-profile.<uid>.<pid>.txt in the temp dir,
+every few seconds while there is something new and again on exit.
+
+Without the variable @profiled returns the method untouched.
+"""
+
+import os, os.path
+import sys
+import time
+import atexit
+import tempfile
+import threading
+import functools
+
+PROFILE = os.environ.get('GEDIT_HACKS_PROFILE', '')
+# seconds between report rewrites
+flush_interval = 10
+
+class Stats:
+    """ Accumulated cost of one profiled method """
+
+    def __init__( self ):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.allocated = 0
+        self.peak = 0
+        self.spawned = 0
+
+    def add( self, elapsed, allocated, peak ):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.allocated += allocated
+        self.peak = max(self.peak, peak)
+
+class Profiler:
+    """ Collects Stats by name and writes them as a plain text table """
+
+    def __init__( self, filename ):
+        self._filename = filename
+        self._stats = {}
+        # names of the profiled calls running in each thread, outermost first
+        self._local = threading.local()
+        self._dirty = False
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    def install( self ):
+        """ Start tracemalloc and count the processes started by every plugin """
+        import tracemalloc
+        import subprocess
+        tracemalloc.start()
+        self._tracemalloc = tracemalloc
+
+        # os.popen goes through subprocess.Popen, multiprocessing through os.fork
+        popen_init = subprocess.Popen.__init__
+        def counted_popen_init( popen, *args, **kwargs ):
+            self.count_spawn()
+            popen_init(popen, *args, **kwargs)
+        subprocess.Popen.__init__ = counted_popen_init
+        for name in ('fork', 'system'):
+            original = getattr(os, name)
+            def counted( *args, _original = original, **kwargs ):
+                self.count_spawn()
+                return _original(*args, **kwargs)
+            setattr(os, name, counted)
+        atexit.register(self.write_report)
+
+    def context( self ):
+        """ Names of the profiled calls running in this thread """
+        return getattr(self._local, 'names', ())
+
+    def run_in( self, context, func, *args, **kwargs ):
+        """ Run func crediting the processes it spawns to the calls of context """
+        previous = self.context()
+        self._local.names = context
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._local.names = previous
+
+    def count_spawn( self ):
+        with self._lock:
+            for name in self.context():
+                self._get_stats(name).spawned += 1
+                self._dirty = True
+
+    def call( self, name, func, *args, **kwargs ):
+        """ Run func, adding its cost to name """
+        context = self.context()
+        outermost = not context
+        # nested calls share the peak of the outermost one
+        if outermost and hasattr(self._tracemalloc, 'reset_peak'):
+            self._tracemalloc.reset_peak()
+        before = self._tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            return self.run_in(context + (name,), func, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            current, peak = self._tracemalloc.get_traced_memory()
+            self.record(name, elapsed, current - before,
+                        max(0, peak - before) if outermost else 0)
+
+    def _get_stats( self, name ):
+        # called with the lock held
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = Stats()
+        return stats
+
+    def record( self, name, elapsed, allocated, peak ):
+        with self._lock:
+            self._get_stats(name).add(elapsed, allocated, peak)
+            self._dirty = True
+            flush = time.time() - self._last_flush > flush_interval or name.endswith('.do_activate')
+        if flush:
+            self.write_report()
+
+    def report( self ):
+        """ The report text, slowest total time first """
+        lines = ['# gedit hacks profile, pid %d, started %s' % (os.getpid(), time.ctime(self._started)),
+                 '# %-58s %7s %10s %10s %12s %12s %6s' % ('name', 'calls', 'total ms', 'max ms', 'net KiB', 'peak KiB', 'procs')]
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda item: -item[1].total)
+            for name, stats in items:
+                lines.append('  %-58s %7d %10.1f %10.1f %12.1f %12.1f %6d' % (
+                    name, stats.calls, stats.total * 1000, stats.max * 1000,
+                    stats.allocated / 1024.0, stats.peak / 1024.0, stats.spawned))
+        return '\n'.join(lines) + '\n'
+
+    def write_report( self ):
+        """ Atomically rewrite the report file if anything was recorded since last time """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._last_flush = time.time()
+        text = self.report()
+        tmp = self._filename + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                f.write(text)
+            os.replace(tmp, self._filename)
+        except OSError as e:
+            print('profiler: cannot write %s: %s' % (self._filename, e), file=sys.stderr)
+
+def report_filename( setting ):
+    """ Report path for the GEDIT_HACKS_PROFILE value, a dir or just a flag """
+    directory = setting if os.path.isdir(setting) else tempfile.gettempdir()
+    return os.path.join(directory, 'gedit-hacks-profile.%s.%s.txt' % (os.getuid(), os.getpid()))
+
+_profiler = None
+
+def get_profiler():
+    """ The session profiler, None when profiling is off """
+    global _profiler
+    if PROFILE and _profiler is None:
+        _profiler = Profiler(report_filename(PROFILE))
+        _profiler.install()
+    return _profiler
+
+def current_context():
+    """ What processes spawned by work submitted now are credited to, None when not profiling """
+    if _profiler is None:
+        return None
+    return _profiler.context()
+
+def run_in_context( context, func, *args, **kwargs ):
+    """ Run func, a job submitted in context, so its processes are credited to it """
+    if context is None or _profiler is None:
+        return func(*args, **kwargs)
+    return _profiler.run_in(context, func, *args, **kwargs)
+
+def profiled( func ):
+    """ Decorator recording the cost of each call as '<plugin> <Class.method>' """
+    profiler = get_profiler()
+    if profiler is None:
+        return func
+    name = '%s %s' % (func.__module__.split('.')[0], func.__qualname__)
+    @functools.wraps(func)
+    def wrapper( *args, **kwargs ):
+        return profiler.call(name, func, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,135 @@
+# -*- coding: utf8 -*-
+#  Code shared by the gedit hacks plugins
+#
+#  Copyright (C) 2012-2013 Rubén Caro
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Project root resolution for Grepint, SnapOpen and Fastprojects """
+
+import os, os.path
+import time
+import hashlib
+import shlex
+import tempfile
+from collections import OrderedDict
+from urllib.parse import urlparse, unquote
+
+# memoized dirs, least recently used ones are dropped beyond this
+max_cached_dirs = 4096
+# seconds before a cached answer is checked again (a repo may be created)
+cache_ttl = 60
+
+def canonicalize( path ):
+    """ Absolute, symlink free path for a path or a file:// uri """
+    if path.startswith('file://'):
+        path = unquote(urlparse(path).path)
+    return os.path.realpath(os.path.expanduser(path))
+
+def is_git_root( path ):
+    # '.git' is a file for worktrees and submodules
+    return os.path.exists(os.path.join(path, '.git'))
+
+class GitRootCache:
+    """ dir -> git root (or None), resolved in-process by looking for .git upwards """
+
+    def __init__( self, max_size = max_cached_dirs, ttl = cache_ttl ):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._roots = OrderedDict()
+
+    def _get( self, path, now ):
+        entry = self._roots.get(path)
+        if entry is None or now - entry[1] > self._ttl:
+            return False, None
+        self._roots.move_to_end(path)
+        return True, entry[0]
+
+    def _set( self, path, root, now ):
+        self._roots[path] = (root, now)
+        self._roots.move_to_end(path)
+        while len(self._roots) > self._max_size:
+            self._roots.popitem(last=False)
+
+    def git_root( self, path ):
+        """ Git root containing given canonical dir, None if it is not inside a repo """
+        now = time.time()
+        visited = []
+        current = path
+        root = None
+        while True:
+            found, cached = self._get(current, now)
+            if found:
+                root = cached
+                break
+            visited.append(current)
+            if is_git_root(current):
+                root = current
+                break
+            parent = os.path.dirname(current)
+            if parent == current:
+                break
+            current = parent
+        # every dir we walked through shares the answer
+        for d in visited:
+            self._set(d, root, now)
+        return root
+
+    def clear( self ):
+        self._roots.clear()
+
+# one cache for every plugin in the process
+git_roots = GitRootCache()
+
+def get_git_base_dir( path ):
+    """ Get git base dir if given path is inside a git repo. None otherwise. """
+    return git_roots.git_root(canonicalize(path))
+
+def collapse_nested( dirs ):
+    """ Canonical, unique dirs with the ones inside other listed dirs removed """
+    # sorted by components, dirs inside another one come right after it
+    unique = []
+    for d in sorted(set(canonicalize(d) for d in dirs), key=lambda d: d.split(os.sep)):
+        if unique and (d == unique[-1] or d.startswith(unique[-1].rstrip(os.sep) + os.sep)):
+            continue
+        unique.append(d)
+    return unique
+
+def map_to_git_base_dirs( dirs ):
+    """ Replace paths with respective git repo base dirs if it exists """
+    mapped = []
+    for d in collapse_nested(dirs):
+        gitdir = git_roots.git_root(d)
+        mapped.append(d if gitdir is None else gitdir)
+    # we could have introduced duplicates here
+    return collapse_nested(mapped)
+
+def get_dirs_string( dirs ):
+    """ Gets the quoted string built with dir list, ready to be passed on to 'find' or 'grep' """
+    return ' '.join(shlex.quote(d) for d in dirs)
+
+def find_projects( root, job = None ):
+    """ Yields every dir under root holding a .git, skipping hidden dirs """
+    for dirname, dirnames, filenames in os.walk(root, followlinks=True):
+        if job is not None and job.cancelled:
+            return
+        if '.git' in dirnames or '.git' in filenames:
+            yield dirname
+        # remove hidden folders
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+
+def project_index_file( root ):
+    """ File list for a project root, written by Fastprojects and read by SnapOpen """
+    digest = hashlib.md5(canonicalize(root).encode('utf-8', 'surrogateescape')).hexdigest()
+    return os.path.join(tempfile.gettempdir(), 'projectindex.%s.%s' % (os.getuid(), digest))
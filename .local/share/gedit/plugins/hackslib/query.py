@@ -0,0 +1,231 @@
+# -*- coding: utf8 -*-
+#  Code shared by the gedit hacks plugins
+#
+#  Copyright (C) 2012-2013 Rubén Caro
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Query planning for Grepint: how a query is matched against file bytes.
+
+Plain queries become a substring search, regexes get the longest literal
+they require as a prefilter, so the regex engine only sees candidate lines.
+"""
+
+import re
+
+AUTO = 'auto'
+LITERAL = 'literal'
+REGEX = 'regex'
+WORD = 'word'
+modes = [AUTO, LITERAL, REGEX, WORD]
+
+# chars that make an auto query a regex
+regex_chars = set('.^$*+?{}[]|()\\')
+# escapes standing for a single literal char
+literal_escapes = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v', 'a': '\a'}
+# chars after the letter of \x.., \u.... and \U........
+hex_escape_digits = {'x': 2, 'u': 4, 'U': 8}
+octal_digits = '01234567'
+# splits text into its ascii runs
+non_ascii_re = re.compile('[^\x00-\x7f]+')
+
+class QueryPlan:
+    """ How to match a query. literal is bytes every matching line contains
+    (None if there is no such literal), regex is None when literal alone decides.
+    text_regex, when set, decides instead of regex on the decoded lines. """
+
+    def __init__( self, mode, query, literal, regex, ignore_case, requested_mode = None, encoding = 'utf-8',
+                  text_regex = None ):
+        self.mode = mode
+        self.query = query
+        self.literal = literal
+        self.regex = regex
+        self.text_regex = text_regex
+        self.ignore_case = ignore_case
+        self.requested_mode = requested_mode or mode
+        self.encoding = encoding
+        # a literal with letters, ignoring case, is found in a lowercased copy of small
+        # files and with a regex in mapped ones, which are never copied
+        self.folded_literal = None
+        self.literal_regex = None
+        if literal and ignore_case and literal.lower() != literal.upper():
+            self.folded_literal = literal.lower()
+            self.literal_regex = re.compile(re.escape(literal), re.IGNORECASE)
+        self._encoded = { encoding: self }
+
+    def for_encoding( self, encoding ):
+        """ The same plan for files in another encoding, None if the query cannot be written in it """
+        if encoding not in self._encoded:
+            if self.query.isascii():
+                # ascii bytes are the same in every encoding we sniff
+                plan = self
+            else:
+                try:
+                    plan = plan_query(self.query, self.requested_mode, self.ignore_case, encoding)
+                except UnicodeEncodeError:
+                    plan = None
+            self._encoded[encoding] = plan
+        return self._encoded[encoding]
+
+    def describe( self ):
+        """ Short text telling how the query runs, for the dialog """
+        if self.regex is None and self.text_regex is None:
+            how = 'substring'
+        else:
+            how = 'regex' if self.regex is not None else 'regex on decoded lines'
+            if self.literal:
+                how += ', prefiltered by %r' % self.literal.decode('utf-8', 'replace')
+        return '%s: %s (%s%s)' % (self.mode, self.query, how, ', ignoring case' if self.ignore_case else '')
+
+def escape_end( pattern, i ):
+    """ Index right after the escape sequence whose letter is at pattern[i] """
+    e = pattern[i]
+    i += 1
+    if e in hex_escape_digits:
+        return min(len(pattern), i + hex_escape_digits[e])
+    if e == 'N' and pattern[i:i + 1] == '{':
+        end = pattern.find('}', i)
+        return len(pattern) if end < 0 else end + 1
+    if e == '0':
+        # \0 and up to two more octal digits
+        end = min(len(pattern), i + 2)
+        while i < end and pattern[i] in octal_digits:
+            i += 1
+        return i
+    if e.isdigit():
+        # three octal digits are a char, otherwise a group number of up to two digits
+        if e in octal_digits and len(pattern) > i + 1 and pattern[i] in octal_digits and pattern[i + 1] in octal_digits:
+            return i + 2
+        if i < len(pattern) and pattern[i].isdigit():
+            return i + 1
+    return i
+
+def longest_literal( pattern ):
+    """ Longest run of chars any match of the regex must contain, '' if unsure.
+    Conservative: only looks outside groups and gives up on alternation. """
+    runs = []
+    current = []
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern):
+            e = pattern[i + 1]
+            i = escape_end(pattern, i + 1)
+            if depth:
+                continue
+            if e in literal_escapes:
+                current.append(literal_escapes[e])
+            elif not e.isalnum():
+                current.append(e)
+            else:
+                # \w, \d, \b, \x41, \N{...}, octal chars, backreferences...
+                runs.append(''.join(current))
+                current = []
+            continue
+        i += 1
+        if c == '|' and depth == 0:
+            return ''
+        if c == '(':
+            depth += 1
+            runs.append(''.join(current))
+            current = []
+        elif c == ')':
+            depth = max(0, depth - 1)
+        elif depth:
+            continue
+        elif c == '[':
+            # skip the class, ']' right after '[' or '[^' belongs to it
+            runs.append(''.join(current))
+            current = []
+            if i < len(pattern) and pattern[i] == '^':
+                i += 1
+            if i < len(pattern) and pattern[i] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+        elif c in '*?{':
+            # the previous char may be missing or repeated
+            if current:
+                current.pop()
+            runs.append(''.join(current))
+            current = []
+            if c == '{':
+                end = pattern.find('}', i)
+                i = len(pattern) if end < 0 else end + 1
+        elif c == '+':
+            # at least once: the char stays, but the run cannot go on past it
+            runs.append(''.join(current))
+            current = []
+        elif c in '.^$':
+            runs.append(''.join(current))
+            current = []
+        else:
+            current.append(c)
+    runs.append(''.join(current))
+    return max(runs, key=len)
+
+def plan_query( query, mode = AUTO, ignore_case = True, encoding = 'utf-8' ):
+    """ QueryPlan for given query text, matching bytes in given encoding.
+    Raises re.error for invalid regexes.
+
+    auto: a plain query is a substring search, words separated by spaces
+          must appear in order on the same line, anything else is a regex,
+          or a substring search again if it is not a valid one
+    literal: the exact text
+    regex: python regex syntax
+    word: the exact text as a whole word
+    """
+    # ^ and $ match at line ends, lines are searched with pos/endpos
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    requested = mode
+    if mode == AUTO:
+        if regex_chars.intersection(query):
+            try:
+                re.compile(query)
+                mode = REGEX
+            except re.error:
+                # 'foo(' or 'a[0' are typed meaning the text, as grep took them
+                mode = LITERAL
+                query = query.strip()
+        elif ' ' in query.strip():
+            words = query.split()
+            pattern = '.*'.join(re.escape(w) for w in words)
+            literal = max(words, key=len)
+        else:
+            mode = LITERAL
+            query = query.strip()
+
+    if mode == LITERAL:
+        pattern, literal = None, query
+    elif mode == WORD:
+        pattern, literal = r'\b%s\b' % re.escape(query), query
+    elif mode == REGEX:
+        pattern, literal = query, longest_literal(query)
+
+    # raises UnicodeEncodeError if the query cannot be found in this encoding
+    query.encode(encoding)
+    if ignore_case and not query.isascii():
+        # bytes only fold ascii case: lines are checked decoded, 'ñandu' finds 'ÑANDU',
+        # prefiltered by the longest ascii run of the literal
+        text_regex = re.compile(re.escape(query) if pattern is None else pattern, flags)
+        literal = max(non_ascii_re.split(literal), key=len).encode(encoding)
+        return QueryPlan(mode, query, literal or None, None, ignore_case, requested, encoding, text_regex)
+
+    regex = None if pattern is None else re.compile(pattern.encode(encoding), flags)
+    literal = literal.encode(encoding)
+    if regex is not None:
+        literal = literal or None
+    return QueryPlan(mode, query, literal, regex, ignore_case, requested, encoding)
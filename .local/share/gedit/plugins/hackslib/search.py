@@ -0,0 +1,321 @@
+# -*- coding: utf8 -*-
+#  Code shared by the gedit hacks plugins
+#
+#  Copyright (C) 2012-2013 Rubén Caro
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" File listing and search used by Grepint, SnapOpen and Fastprojects.
+Nothing here needs gtk, so it can be driven from the benchmarks too. """
+
+import os, os.path
+import re
+import codecs
+import mmap
+import shlex
+import fnmatch
+from subprocess import Popen, PIPE, STDOUT
+from hackslib.projectroots import get_dirs_string
+from hackslib.workers import kill_group, kill_on_cancel
+from hackslib import query
+
+# what SnapOpen and the prewarm leave out of file lists
+skip_dirs = ['.git', '.svn']
+skip_exts = ['.jpg', '.jpeg', '.gif', '.png', '.psd', '.tif',
+             '.o', '.so', '.lo', '.plo', '.a', '.pyc', '.swp']
+# what Grepint leaves out of project searches
+grep_glob_excludes = ['*.log', '*~', '*.swp']
+grep_dir_excludes = ['.git', '.svn', 'log']
+grep_exclude_re = re.compile('|'.join(fnmatch.translate(g) for g in grep_glob_excludes))
+# bytes sniffed at the start of each file for binary content and encoding
+sniff_size = 8192
+# for files, and lines, that are not valid utf-8. Never fails to decode.
+fallback_encoding = 'latin-1'
+# smaller files are read, mapping them costs more than it saves
+mmap_min_size = 256 * 1024
+# shown text of a matching line
+max_line_text = 160
+# grep flags giving each query mode's syntax, perl's is the closest to python regexes
+grep_mode_flags = {query.LITERAL: '-F', query.WORD: '-wF', query.AUTO: '-E', query.REGEX: '-P'}
+
+def walk_files( paths, pruned_dirs, skip_name, job = None ):
+    """ Yields the regular files, or symlinks to them, under paths, depth first in
+    directory order. Dirs named in pruned_dirs and symlinked dirs are not entered,
+    files whose name skip_name is true for are left out. Dir entries give the file
+    type without a stat. """
+    pending = []
+    for path in reversed(paths):
+        if os.path.isdir(path):
+            pending.append(path)
+        elif os.path.isfile(path):
+            yield path
+    while pending:
+        if job is not None and job.cancelled:
+            return
+        dirs = []
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in pruned_dirs:
+                                dirs.append(entry.path)
+                        elif entry.is_file() and not skip_name(entry.name):
+                            yield entry.path
+                    except OSError:
+                        pass
+        except OSError:
+            continue
+        pending.extend(reversed(dirs))
+
+def skipped_from_listing( name ):
+    """ Whether SnapOpen leaves out a file by its name """
+    lower = name.lower()
+    return lower.endswith('~') or os.path.splitext(lower)[1] in skip_exts
+
+def list_files( root, job = None ):
+    """ Yields every file under root worth listing, the same as find_command, which
+    like us lists symlinks to files (-xtype f) and does not enter symlinked dirs """
+    return walk_files([root], skip_dirs, skipped_from_listing, job)
+
+def find_command( dirs, listfile ):
+    """ Shell command writing the file list of dirs to listfile, replaced only when complete.
+    Lists the same files as list_files: only dirs named in skip_dirs are pruned. """
+    prune = ' -o '.join("-name '%s'" % d for d in skip_dirs)
+    filters = ' '.join("! -iname '*%s'" % ext for ext in skip_exts)
+    filters += " ! -iname '*~'"
+    listfile = shlex.quote(listfile)
+    return "find %s -type d \\( %s \\) -prune -o \\( -type f -o -type l -xtype f \\) %s -print > %s.new 2> /dev/null; mv %s.new %s" % (
+        get_dirs_string(dirs), prune, filters, listfile, listfile, listfile)
+
+def fuzzy_regex( query ):
+    """ Words of the query in order, anything in between """
+    return query.replace(" ", ".*")
+
+def fuzzy_command( query, listfile, max_result ):
+    """ Shell command printing the first max_result lines of listfile matching query """
+    return "grep -i -m %d -e %s %s 2> /dev/null" % (
+        max_result, shlex.quote(fuzzy_regex(query)), shlex.quote(listfile))
+
+def grep_command( plan, paths, max_result = None ):
+    """ Shell command printing 'path:line:text' for the lines under paths matching plan,
+    only the first max_result unless None. For plans folding case in python (text_regex)
+    it prints the lines holding their ascii literal, grep_paths checks the rest. """
+    if plan.text_regex is not None:
+        flags = '-F -i'
+        patterns = [plan.literal.decode('ascii')]
+    else:
+        flags = grep_mode_flags[plan.mode]
+        if plan.ignore_case:
+            flags += ' -i'
+        if plan.mode == query.AUTO:
+            # words in order, auto queries with spaces have no regex chars
+            text = '.*'.join(plan.query.split())
+        else:
+            text = plan.query
+        # the bytes of the query in every encoding search_paths finds it in, as
+        # a str the shell gets back as those bytes
+        patterns = []
+        for encoding in ('utf-8', fallback_encoding):
+            if plan.for_encoding(encoding) is not None:
+                pattern = text.encode(encoding).decode('utf-8', 'surrogateescape')
+                if pattern not in patterns:
+                    patterns.append(pattern)
+        if plan.mode == query.REGEX and len(patterns) > 1:
+            # -P takes a single pattern
+            patterns = ['|'.join('(?:%s)' % p for p in patterns)]
+    excludes = ' '.join('--exclude=%s' % g for g in grep_glob_excludes)
+    excludes += ' ' + ' '.join('--exclude-dir=%s' % d for d in grep_dir_excludes)
+    patterns = ' '.join('-e %s' % shlex.quote(p) for p in patterns)
+    head = '' if max_result is None else ' | head -n%d' % max_result
+    # in a utf-8 locale grep skips files that are not utf-8 as binary, in the C locale it
+    # matches bytes as our bytes regexes do. grep's complaints would be taken for hits.
+    return "LC_ALL=C grep -nHRI -D skip %s %s %s %s 2> /dev/null%s" % (
+        flags, excludes, patterns, get_dirs_string(paths), head)
+
+def parse_grep_line( hit ):
+    """ (path, line number, text) from a 'path:line:text' line """
+    parts = hit.split(':')
+    path, line = parts[0:2]
+    text = ':'.join(parts[2:])[:max_line_text].replace("\n", '').strip()
+    return path, line, text
+
+def decode_line( raw, encoding = 'utf-8' ):
+    """ Text of a line in given encoding, falling back on fallback_encoding
+    for lines with stray bytes, so no line is lost """
+    try:
+        return raw.decode(encoding)
+    except UnicodeDecodeError:
+        return raw.decode(fallback_encoding)
+
+def sniff_encoding( block ):
+    """ Encoding of a file from its first bytes, None if it looks binary """
+    if block.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if block.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    if b'\0' in block:
+        return None
+    try:
+        block.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # a sequence cut at the end of the block is still utf-8
+        if e.reason != 'unexpected end of data' or e.start < len(block) - 3:
+            return fallback_encoding
+    return 'utf-8'
+
+def iter_lines( cmd, job = None ):
+    """ Yields the output lines of the given cmd, decoding those that are not
+    utf-8 with fallback_encoding. The command is killed with its children if job
+    is cancelled, or if the caller stops before the end. """
+    p = Popen(cmd, shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True,
+              start_new_session=True)
+    if job is not None:
+        kill_on_cancel(job, p)
+    finished = False
+    try:
+        for s in p.stdout:
+            yield decode_line(s)
+        finished = True
+    finally:
+        if not finished:
+            kill_group(p)
+        p.stdout.close()
+        p.wait()
+
+def run_lines( cmd, job = None ):
+    """ Gets the output lines of the given cmd, as iter_lines yields them """
+    return list(iter_lines(cmd, job))
+
+def grep_files( paths, job = None ):
+    """ Yields the regular files a project search looks into, as grep -R -D skip
+    with our excludes would """
+    return walk_files(paths, grep_dir_excludes, grep_exclude_re.match, job)
+
+def matching_lines( data, plan, max_hits ):
+    """ (line number, start, end) of the lines of data (bytes or mmap) matching plan """
+    hits = []
+    literal = plan.literal
+    literal_regex = None
+    hay = data
+    if plan.folded_literal is not None:
+        if isinstance(data, bytes):
+            # small enough to be read, find in a lowercased copy beats the regex
+            literal = plan.folded_literal
+            hay = data.lower()
+        else:
+            literal_regex = plan.literal_regex
+    pos = 0
+    lineno = 1
+    counted = 0
+    while len(hits) < max_hits:
+        if literal_regex is not None:
+            m = literal_regex.search(data, pos)
+            found = -1 if m is None else m.start()
+        elif literal:
+            found = hay.find(literal, pos)
+        elif plan.regex is not None:
+            m = plan.regex.search(data, pos)
+            found = -1 if m is None else m.start()
+        else:
+            # nothing to look for in bytes, every line is a candidate
+            found = pos if pos < len(data) else -1
+        if found < 0:
+            break
+        start = data.rfind(b'\n', 0, found) + 1
+        end = data.find(b'\n', found)
+        if end < 0:
+            end = len(data)
+        if plan.text_regex is not None:
+            matched = plan.text_regex.search(decode_line(data[start:end], plan.encoding))
+        else:
+            matched = plan.regex is None or plan.regex.search(data, start, end)
+        if matched:
+            lineno += data[counted:start].count(b'\n')
+            counted = start
+            hits.append((lineno, start, end))
+        pos = end + 1
+    return hits
+
+def search_data( data, plan, max_hits ):
+    """ (line number, text) of the lines of file contents matching plan, none if binary.
+    Raw bytes are searched, only the matching lines get decoded. """
+    encoding = sniff_encoding(data[:sniff_size])
+    if encoding is None:
+        return []
+    if encoding == 'utf-16':
+        # the only encoding we cannot search as is, rare enough to transcode
+        data = data[:].decode('utf-16', 'replace').encode('utf-8')
+        encoding = 'utf-8'
+    elif encoding == 'utf-8-sig':
+        encoding = 'utf-8'
+    file_plan = plan.for_encoding(encoding)
+    if file_plan is None:
+        return []
+    hits = []
+    for lineno, start, end in matching_lines(data, file_plan, max_hits):
+        text = decode_line(data[start:end], encoding)
+        if lineno == 1:
+            text = text.lstrip('\ufeff')
+        hits.append((lineno, text[:max_line_text].strip()))
+    return hits
+
+def search_file( path, plan, max_hits ):
+    """ (line number, text) of the lines of a text file matching plan """
+    # raw fds, a python file object costs more than reading a small file
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return []
+    try:
+        size = os.fstat(fd).st_size
+        if size < mmap_min_size:
+            return search_data(os.read(fd, size), plan, max_hits)
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as data:
+            return search_data(data, plan, max_hits)
+    except (OSError, ValueError):
+        return []
+    finally:
+        os.close(fd)
+
+def grep_paths( plan, paths, max_result, job = None ):
+    """ (path, line number, text) for the first max_result matching lines under paths, found by grep.
+    Faster than search_paths on whole projects, and it does not hold the GIL while it runs. """
+    if plan.text_regex is None:
+        return [parse_grep_line(hit) for hit in run_lines(grep_command(plan, paths, max_result), job)
+                if hit.count(':') >= 2]
+    if not plan.literal:
+        # nothing grep can look for, every line needs python
+        return search_paths(plan, paths, max_result, job)
+    # grep finds the lines with the ascii part of the query, the case of the rest is folded here
+    results = []
+    for hit in iter_lines(grep_command(plan, paths), job):
+        parts = hit.split(':', 2)
+        if len(parts) == 3 and plan.text_regex.search(parts[2]):
+            results.append(parse_grep_line(hit))
+            if len(results) >= max_result:
+                break
+    return results
+
+def search_paths( plan, paths, max_result, job = None ):
+    """ (path, line number, text) for the first max_result matching lines under paths """
+    results = []
+    for path in grep_files(paths, job):
+        if job is not None and job.cancelled:
+            break
+        for lineno, text in search_file(path, plan, max_result - len(results)):
+            results.append((path, str(lineno), text))
+        if len(results) >= max_result:
+            break
+    return results
@@ -0,0 +1,207 @@
+# -*- coding: utf8 -*-
+#  Code shared by the gedit hacks plugins
+#
+#  Copyright (C) 2012-2013 Rubén Caro
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Background jobs for every plugin: one bounded pool of worker threads with
+priorities, cancellation and results delivered on the gtk main loop.
+
+    job = workers.get_pool().submit(func, arg, priority=workers.INTERACTIVE,
+                                    callback=on_result)
+    ...
+    job.cancel()
+
+func is called in a worker thread as func(arg, job=job), it must not touch
+gtk and should check job.cancelled now and then if it runs for long. Its
+result is handed to callback on the main loop, unless the job was cancelled.
+"""
+
+import os
+import signal
+import heapq
+import itertools
+import threading
+import traceback
+from hackslib import profiler
+
+# priority classes, lower runs first
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# background jobs queued beyond this are rejected
+max_pending_background = 64
+
+class Job:
+    """ A submitted piece of work, also its cancellation token """
+
+    def __init__( self, func, args, priority, key ):
+        self.func = func
+        self.args = args
+        self.priority = priority
+        self.key = key
+        self.cancelled = False
+        # refused by back-pressure, it never runs
+        self.rejected = False
+        self.callbacks = []
+        # the profiled calls that submitted it get the processes it spawns
+        self.profile_context = profiler.current_context()
+        self._cancel_callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel( self ):
+        """ Skip the job if not started yet, and never deliver its result """
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks = self._cancel_callbacks
+            self._cancel_callbacks = []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                traceback.print_exc()
+
+    def add_cancel_callback( self, callback ):
+        """ Run callback on cancel, e.g. to kill a subprocess. Runs now if already cancelled. """
+        with self._lock:
+            if not self.cancelled:
+                self._cancel_callbacks.append(callback)
+                return
+        callback()
+
+def kill_group( process ):
+    """ Kill the whole process group of a Popen(..., start_new_session=True) """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+def kill_on_cancel( job, process ):
+    """ Kill the process group of process when job is cancelled """
+    job.add_cancel_callback(lambda: kill_group(process))
+
+class WorkerPool:
+    """ Bounded pool of daemon threads, started on demand.
+    One worker is always kept free of background jobs for interactive ones. """
+
+    def __init__( self, max_workers = None, dispatch = None ):
+        if max_workers is None:
+            max_workers = min(4, max(2, os.cpu_count() or 1))
+        if dispatch is None:
+            # imported here so jobs can also run headless, e.g. from the benchmarks
+            from gi.repository import GLib
+            dispatch = GLib.idle_add
+        self._max_workers = max_workers
+        self._dispatch = dispatch
+        self._queue = []
+        self._counter = itertools.count()
+        self._keyed = {}
+        self._workers = 0
+        self._idle = 0
+        self._running_background = 0
+        self._pending_background = 0
+        self._cond = threading.Condition()
+
+    def submit( self, func, *args, priority = BACKGROUND, callback = None, key = None ):
+        """ Queue func(*args, job=job). Jobs with the same key as a pending or
+        running one are not queued again, the existing job is returned instead. """
+        with self._cond:
+            if key is not None and key in self._keyed and not self._keyed[key].cancelled:
+                job = self._keyed[key]
+                if callback is not None:
+                    job.callbacks.append(callback)
+                return job
+
+            job = Job(func, args, priority, key)
+            if callback is not None:
+                job.callbacks.append(callback)
+            if priority >= BACKGROUND:
+                if self._pending_background >= max_pending_background:
+                    # back-pressure: the caller gets a job that will never run
+                    job.cancelled = True
+                    job.rejected = True
+                    return job
+                self._pending_background += 1
+            if key is not None:
+                self._keyed[key] = job
+            heapq.heappush(self._queue, (priority, next(self._counter), job))
+            if self._idle == 0 and self._workers < self._max_workers:
+                self._workers += 1
+                threading.Thread(target=self._work, name='hackslib-worker', daemon=True).start()
+            self._cond.notify_all()
+        return job
+
+    def _next_job( self ):
+        # called with the lock held, None if nothing can run now
+        if not self._queue:
+            return None
+        priority, count, job = self._queue[0]
+        if priority >= BACKGROUND and self._running_background >= self._max_workers - 1:
+            return None
+        heapq.heappop(self._queue)
+        if priority >= BACKGROUND:
+            self._pending_background -= 1
+            self._running_background += 1
+        return job
+
+    def _work( self ):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._idle += 1
+                    self._cond.wait()
+                    self._idle -= 1
+                    job = self._next_job()
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    if job.priority >= BACKGROUND:
+                        self._running_background -= 1
+                    if job.key is not None and self._keyed.get(job.key) is job:
+                        del self._keyed[job.key]
+                    self._cond.notify_all()
+
+    def _run( self, job ):
+        if job.cancelled:
+            return
+        try:
+            result = profiler.run_in_context(job.profile_context, job.func, *job.args, job=job)
+        except Exception:
+            traceback.print_exc()
+            return
+        if not job.cancelled and job.callbacks:
+            self._dispatch(self._deliver, job, result)
+
+    def _deliver( self, job, result ):
+        # on the main loop, the job may have been cancelled meanwhile
+        if not job.cancelled:
+            for callback in job.callbacks:
+                callback(result)
+        return False
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """ The pool shared by every plugin of this gedit process """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool
@@ -25,7 +25,7 @@
 
 from gi.repository import GObject, Gtk, Gedit, PeasGtk
 
-from .smart_highlight import SmartHighlightWindowHelper
+from .smart_highlight import SmartHighlightWindowHelper, profiled
 from .config_ui import ConfigUI
 #import config_manager
 
@@ -37,6 +37,7 @@ class SmartHighlightingPlugin(GObject.Object, Gedit.WindowActivatable):
 	def __init__(self):
 		GObject.Object.__init__(self)
 
+	@profiled
 	def do_activate(self):
 		self._plugin = SmartHighlightWindowHelper(self, self.window)
 
@@ -24,42 +24,63 @@
 
 
 import os
-from xml.dom.minidom import parse
+import shutil
+from xml.etree import ElementTree
+
+#One manager per config file for the whole gedit process, shared by every window.
+_shared_managers = {}
+
+def get_shared_manager(filename, default_file = None):
+	if filename not in _shared_managers:
+		if not os.path.exists(filename) and default_file != None:
+			if not os.path.exists(os.path.dirname(filename)):
+				os.makedirs(os.path.dirname(filename))
+			shutil.copy2(default_file, filename)
+		_shared_managers[filename] = ConfigManager(filename)
+	return _shared_managers[filename]
 
 class ConfigManager:
 	def __init__(self, filename):
+		self.config_file = filename
+		self.branches = {}		#branch -> dict handed out by load_configure
+		self.saved = {}			#branch -> values as last read from / written to the file
 		if os.path.exists(filename) == True:
-			self.config_file = filename
-			self.dom = parse(filename) # parse an XML file by name
-			#self.root = self.dom.documentElement
+			self.tree = ElementTree.parse(filename) # parse an XML file by name
+		else:
+			self.tree = ElementTree.ElementTree(ElementTree.Element('manifest'))
 	
 	def get_configure(self, branch, attr):
-		root = self.dom.documentElement
-		nodes = root.getElementsByTagName(branch)
-		for i in range(0, len(nodes)):
-			if nodes[i].getAttribute('name') == attr:
-				return nodes[i].firstChild.nodeValue
+		for node in self.tree.getroot().iter(branch):
+			if node.get('name') == attr:
+				return node.text
 	
 	def load_configure(self, branch):
-		root = self.dom.documentElement
-		nodes = root.getElementsByTagName(branch)
-		dic = {}
-		for i in range(0, len(nodes)):
-			dic[nodes[i].getAttribute('name')] = nodes[i].firstChild.nodeValue
-		return dic
+		#Every caller gets the same dict, so changes are seen by all windows.
+		if branch not in self.branches:
+			dic = {}
+			for node in self.tree.getroot().iter(branch):
+				dic[node.get('name')] = node.text
+			self.branches[branch] = dic
+			self.saved[branch] = dict(dic)
+		return self.branches[branch]
 	
 	def update_config_file(self, filename, branch, dic):
-		root = self.dom.documentElement
-		nodes = root.getElementsByTagName(branch)
-		for i in range(0, len(nodes)):
-			nodes[i].firstChild.nodeValue = dic[nodes[i].getAttribute('name')]
+		values = dict((key, str(value)) for key, value in dic.items())
+		if values == self.saved.get(branch):
+			return
+		for node in self.tree.getroot().iter(branch):
+			if node.get('name') in values:
+				node.text = values[node.get('name')]
 
-		f = open(filename, 'w+')
-		#print(bytes.decode(self.dom.toprettyxml('', '', 'utf-8'), 'utf-8'))
-		f.write(bytes.decode(self.dom.toprettyxml('', '', 'utf-8'), 'utf-8'))
-		f.close
+		#Write a temporary file and rename it, a crash never leaves a truncated config.
+		tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+		self.tree.write(tmp_filename, encoding = 'utf-8', xml_declaration = True)
+		os.replace(tmp_filename, filename)
+		self.saved[branch] = values
 		
 	def boolean(self, string):
+		if isinstance(string, bool):
+			return string
 		return string.lower() in ['true', 'yes', 't', 'y', 'ok', '1']
 		
 	def to_bool(self, dic):
@@ -24,11 +24,19 @@
 
 
 
-from gi.repository import Gtk, Gdk, Gedit
+from gi.repository import Gtk, Gdk, Gedit, GLib
 import re
 import os.path
+import functools
+import bisect
 #import pango
-import shutil
+
+try:
+	from hackslib.profiler import profiled
+except ImportError:
+	#installed alone, without the other hacks plugins: no profiling
+	def profiled(func):
+		return func
 
 from . import config_manager
 from .config_ui import ConfigUI
@@ -47,6 +55,15 @@ except:
 	pass
 #gettext.install(APP_NAME, LOCALE_DIR, unicode=True)
 
+#Bursts of mark-set events (drag selection, cursor moves) are coalesced into one job.
+HIGHLIGHT_DELAY = 60		#ms
+#Lines highlighted above and below the visible area of the view.
+VIEWPORT_MARGIN = 50
+#Longer selections are not worth highlighting and would build a giant regex.
+MAX_SELECTION_LENGTH = 1024
+#Lines scanned per idle slice when counting occurrences in the whole document.
+INDEX_CHUNK_LINES = 2000
+
 
 ui_str = """<ui>
 	<menubar name="MenuBar">
@@ -55,6 +72,8 @@ ui_str = """<ui>
 				<separator/>
 				<menu name="SmartHighlightMenu" action="SmartHighlightMenu">
 					<placeholder name="SmartHighlightMenuHolder">
+						<menuitem name="smart_highlight_next" action="smart_highlight_next"/>
+						<menuitem name="smart_highlight_previous" action="smart_highlight_previous"/>
 						<menuitem name="smart_highlight_configure" action="smart_highlight_configure"/>
 					</placeholder>
 				</menu>
@@ -66,28 +85,271 @@ ui_str = """<ui>
 """
 
 
+@functools.lru_cache(maxsize = 32)
+def compile_pattern(pattern, match_case, match_whole_word, regex_search):
+	#Compiled regex for a selection and search options, None if it is invalid or matches nothing at all.
+	if regex_search == False:
+		pattern = re.escape(pattern)
+
+	if match_whole_word == True:
+		pattern = r'\b%s\b' % pattern
+
+	flags = re.MULTILINE
+	if match_case == False:
+		flags |= re.IGNORECASE
+	try:
+		regex = re.compile(pattern, flags)
+	except re.error:
+		return None
+	if regex.match('') != None:
+		return None
+	return regex
+
+def is_highlightable(selection):
+	#Skip empty, blank and huge selections.
+	return selection.strip() != '' and len(selection) <= MAX_SELECTION_LENGTH
+
+def missing_line_ranges(covered, start, end):
+	#Parts of [start, end) not in covered, a sorted list of disjoint [start, end) ranges.
+	gaps = []
+	for covered_start, covered_end in covered:
+		if covered_end <= start:
+			continue
+		if covered_start >= end:
+			break
+		if covered_start > start:
+			gaps.append((start, covered_start))
+		start = max(start, covered_end)
+	if start < end:
+		gaps.append((start, end))
+	return gaps
+
+def add_line_range(covered, start, end):
+	#Insert [start, end) into covered, merging overlapping and adjacent ranges.
+	merged = []
+	for covered_start, covered_end in covered:
+		if covered_end < start or covered_start > end:
+			merged.append((covered_start, covered_end))
+		else:
+			start = min(start, covered_start)
+			end = max(end, covered_end)
+	merged.append((start, end))
+	merged.sort()
+	covered[:] = merged
+
+
+class HandlerRegistry:
+	#Signal connections grouped by owner (a tab, the window), so all of them can be dropped at once.
+	def __init__(self):
+		self.handlers = {}
+
+	def connect(self, owner, obj, signal, callback, *args):
+		handler_id = obj.connect(signal, callback, *args)
+		self.handlers.setdefault(owner, []).append((obj, handler_id))
+		return handler_id
+
+	def disconnect(self, owner):
+		for obj, handler_id in self.handlers.pop(owner, []):
+			if obj.handler_is_connected(handler_id):
+				obj.disconnect(handler_id)
+
+	def disconnect_all(self):
+		for owner in list(self.handlers.keys()):
+			self.disconnect(owner)
+
+
+class DocumentHighlightState:
+	#Highlighting state of one document: its selection, tagged ranges, tag, pending jobs and occurrence index.
+	def __init__(self, helper, doc):
+		self.helper = helper
+		self.doc = doc
+		self.selection = ''
+		self.highlight_source_id = None
+		self.tagged_lines = []		#line ranges already scanned for selection
+		self.tagged_marks = []		#(start, end) marks around every scanned range, the only places holding the tag
+		self.tag = None
+		self.occurrence_starts = []	#sorted offsets of selection in the whole document
+		self.occurrence_ends = []
+		self.index_source_id = None
+		self.index_line = 0
+
+	def destroy(self):
+		self.cancel_highlight()
+		self.clear()
+		self.helper = None
+
+	def schedule_highlight(self):
+		#Supersede any pending job, only the last event of a burst does the work.
+		self.cancel_highlight()
+		self.highlight_source_id = GLib.timeout_add(HIGHLIGHT_DELAY, self.on_highlight_timeout, priority = GLib.PRIORITY_DEFAULT_IDLE)
+
+	def cancel_highlight(self):
+		if self.highlight_source_id != None:
+			GLib.source_remove(self.highlight_source_id)
+			self.highlight_source_id = None
+
+	def on_highlight_timeout(self):
+		self.highlight_source_id = None
+		doc = self.doc
+		if doc.get_selection_bounds():
+			start, end = doc.get_selection_bounds()
+			selection = doc.get_text(start, end, True)
+		else:
+			selection = ''
+		if not is_highlightable(selection):
+			selection = ''
+		if selection == self.selection:
+			return False
+		self.selection = selection
+		self.clear()
+		if selection != '':
+			regex = self.helper.create_regex(selection, self.helper.options)
+			if regex != None:
+				self.start_occurrence_index(regex)
+				self.highlight_viewport(Gedit.Tab.get_from_document(doc).get_view())
+		return False
+
+	def highlight_viewport(self, view):
+		regex = self.helper.create_regex(self.selection, self.helper.options)
+		if regex == None:
+			return
+		#Only scan the lines of the viewport which were not scanned before.
+		start_line, end_line = self.helper.get_viewport_lines(view)
+		for gap_start, gap_end in missing_line_ranges(self.tagged_lines, start_line, end_line):
+			self.highlight_lines(regex, gap_start, gap_end)
+			add_line_range(self.tagged_lines, gap_start, gap_end)
+
+	def highlight_lines(self, regex, start_line, end_line):
+		doc = self.doc
+		start_iter = doc.get_iter_at_line(start_line)
+		if end_line < doc.get_line_count():
+			end_iter = doc.get_iter_at_line(end_line)
+		else:
+			end_iter = doc.get_end_iter()
+		#Marks follow edits, so the range can still be cleared exactly later on.
+		self.tagged_marks.append((doc.create_mark(None, start_iter, True), doc.create_mark(None, end_iter, False)))
+
+		#get_slice keeps one character per buffer position, so match offsets map 1:1 to iter moves.
+		text = doc.get_slice(start_iter, end_iter, True)
+		self.tag_matches(regex.finditer(text), start_iter)
+
+	def get_tag(self):
+		if self.tag == None:
+			doc = self.doc
+			self.tag = doc.get_tag_table().lookup('smart_highlight')
+			if self.tag == None:
+				colors = self.helper.smart_highlight
+				self.tag = doc.create_tag("smart_highlight", foreground=colors['FOREGROUND_COLOR'], background=colors['BACKGROUND_COLOR'])
+		return self.tag
+
+	def tag_matches(self, matches, start_iter):
+		#Tag every match in one pass, walking a single iter forward from the previous match.
+		doc = self.doc
+		tag = self.get_tag()
+		match_start = start_iter.copy()
+		offset = 0
+		for match in matches:
+			if match.end() == match.start():
+				continue
+			match_start.forward_chars(match.start() - offset)
+			match_end = match_start.copy()
+			match_end.forward_chars(match.end() - match.start())
+			doc.apply_tag(tag, match_start, match_end)
+			match_start = match_end
+			offset = match.end()
+
+	def clear(self):
+		#Only the ranges we scanned can hold the tag, no need to walk the whole buffer.
+		doc = self.doc
+		for start_mark, end_mark in self.tagged_marks:
+			if start_mark.get_deleted() or end_mark.get_deleted():
+				continue
+			doc.remove_tag_by_name('smart_highlight', doc.get_iter_at_mark(start_mark), doc.get_iter_at_mark(end_mark))
+			doc.delete_mark(start_mark)
+			doc.delete_mark(end_mark)
+		self.tagged_marks = []
+		self.tagged_lines = []
+		self.cancel_occurrence_index()
+		if self.helper != None:
+			self.helper.update_status(self)
+
+	def start_occurrence_index(self, regex):
+		#Count every occurrence in the background, a chunk of lines per idle call.
+		self.cancel_occurrence_index()
+		self.index_line = 0
+		self.index_source_id = GLib.idle_add(self.on_index_idle, regex, priority = GLib.PRIORITY_LOW)
+
+	def cancel_occurrence_index(self):
+		if self.index_source_id != None:
+			GLib.source_remove(self.index_source_id)
+			self.index_source_id = None
+		self.occurrence_starts = []
+		self.occurrence_ends = []
+
+	def on_index_idle(self, regex):
+		doc = self.doc
+		line_count = doc.get_line_count()
+		start_iter = doc.get_iter_at_line(self.index_line)
+		end_line = self.index_line + INDEX_CHUNK_LINES
+		if end_line < line_count:
+			end_iter = doc.get_iter_at_line(end_line)
+		else:
+			end_iter = doc.get_end_iter()
+		base = start_iter.get_offset()
+		for match in regex.finditer(doc.get_slice(start_iter, end_iter, True)):
+			if match.end() != match.start():
+				self.occurrence_starts.append(base + match.start())
+				self.occurrence_ends.append(base + match.end())
+		self.index_line = end_line
+		if end_line < line_count:
+			return True
+		self.index_source_id = None
+		self.helper.update_status(self)
+		return False
+
+	def is_indexed(self):
+		return self.selection != '' and self.index_source_id == None
+
+	def goto_occurrence(self, view, forward):
+		doc = self.doc
+		if not self.is_indexed() or len(self.occurrence_starts) == 0:
+			return None
+		if doc.get_selection_bounds():
+			offset = doc.get_selection_bounds()[0].get_offset()
+		else:
+			offset = doc.get_iter_at_mark(doc.get_insert()).get_offset()
+		#Binary search on the index, wrapping around at both ends.
+		count = len(self.occurrence_starts)
+		if forward:
+			i = bisect.bisect_right(self.occurrence_starts, offset) % count
+		else:
+			i = (bisect.bisect_left(self.occurrence_starts, offset) - 1) % count
+		doc.select_range(doc.get_iter_at_offset(self.occurrence_starts[i]), doc.get_iter_at_offset(self.occurrence_ends[i]))
+		view.scroll_to_mark(doc.get_insert(), 0.25, False, 0.0, 0.0)
+		return i
+
+	def on_changed(self):
+		#Offsets are stale after an edit, count again.
+		if self.selection == '':
+			return
+		regex = self.helper.create_regex(self.selection, self.helper.options)
+		if regex != None:
+			self.start_occurrence_index(regex)
+
 
 class SmartHighlightWindowHelper:
 	def __init__(self, plugin, window):
 		self._window = window
 		self._plugin = plugin
-		self.current_selection = ''
-		self.start_iter = None
-		self.end_iter = None
-		self.vadj_value = 0
-		views = self._window.get_views()
-		for view in views:
-			view.get_buffer().connect('mark-set', self.on_textbuffer_markset_event)
-			view.get_vadjustment().connect('value-changed', self.on_view_vadjustment_value_changed)
-			#view.connect('button-press-event', self.on_view_button_press_event)
-		self.active_tab_added_id = self._window.connect("tab-added", self.tab_added_action)
-
-		user_configfile = os.path.join(CONFIG_DIR, 'config.xml')
-		if not os.path.exists(user_configfile):
-			if not os.path.exists(os.path.dirname(user_configfile)):
-				os.makedirs(os.path.dirname(user_configfile))
-			shutil.copy2(os.path.dirname(__file__) + "/config/config.xml", os.path.dirname(user_configfile))
-		configfile = user_configfile
+		self.doc_states = {}		#doc -> DocumentHighlightState, from tab-added to tab-removed
+		self.handlers = HandlerRegistry()
+		for doc in self._window.get_documents():
+			self.tab_added_action(self._window, Gedit.Tab.get_from_document(doc))
+		self.handlers.connect(self._window, self._window, "tab-added", self.tab_added_action)
+		self.handlers.connect(self._window, self._window, "tab-removed", self.tab_removed_action)
+		self.handlers.connect(self._window, self._window, "active-tab-changed", self.active_tab_changed_action)
+
+		configfile = os.path.join(CONFIG_DIR, 'config.xml')
 		'''		
 		user_configfile = os.path.join(os.path.expanduser('~/.local/share/gedit/plugins/' + 'smart_highlight'), 'config.xml')
 		if os.path.exists(user_configfile):
@@ -95,7 +357,8 @@ class SmartHighlightWindowHelper:
 		else:	
 			configfile = os.path.join(os.path.dirname(__file__), "config.xml")
 		#'''
-		self.config_manager = config_manager.ConfigManager(configfile)
+		#Parsed once per gedit process, the copy of the default config happens then too.
+		self.config_manager = config_manager.get_shared_manager(configfile, os.path.join(os.path.dirname(__file__), 'config', 'config.xml'))
 		self.options = self.config_manager.load_configure('search_option')
 		self.config_manager.to_bool(self.options)
 		self.smart_highlight = self.config_manager.load_configure('smart_highlight')
@@ -104,7 +367,11 @@ class SmartHighlightWindowHelper:
 
 	def deactivate(self):
 		# Remove any installed menu items
-		self._window.disconnect(self.active_tab_added_id)
+		self._remove_menu()
+		self.handlers.disconnect_all()
+		for state in list(self.doc_states.values()):
+			state.destroy()
+		self.doc_states = {}
 		self.config_manager.update_config_file(self.config_manager.config_file, 'search_option', self.options)
 		self.config_manager.update_config_file(self.config_manager.config_file, 'smart_highlight', self.smart_highlight)
 		
@@ -115,6 +382,8 @@ class SmartHighlightWindowHelper:
 		# Create a new action group
 		self._action_group = Gtk.ActionGroup("SmartHighlightActions")
 		self._action_group.add_actions( [("SmartHighlightMenu", None, _('Smart Highlighting'))] + \
+										[("smart_highlight_next", None, _("Next Occurrence"), "<Ctrl><Alt>period", _("Select the next occurrence of the highlighted text"), self.on_next_occurrence)] + \
+										[("smart_highlight_previous", None, _("Previous Occurrence"), "<Ctrl><Alt>comma", _("Select the previous occurrence of the highlighted text"), self.on_previous_occurrence)] + \
 										[("smart_highlight_configure", None, _("Configuration"), None, _("Smart Highlighting Configure"), self.smart_highlight_configure)]) 
 
 		# Insert the action group
@@ -152,85 +421,95 @@ class SmartHighlightWindowHelper:
 		
 		
 	def create_regex(self, pattern, options):
-		if options['REGEX_SEARCH'] == False:
-			pattern = re.escape(str(r'%s' % pattern))
-		else:
-			pattern = str(r'%s' % pattern)
-		
-		if options['MATCH_WHOLE_WORD'] == True:
-			pattern = r'\b%s\b' % pattern
-			
-		if options['MATCH_CASE'] == True:
-			regex = re.compile(pattern, re.MULTILINE)
-		else:
-			regex = re.compile(pattern, re.IGNORECASE | re.MULTILINE)
-		
-		return regex
+		return compile_pattern(pattern, options['MATCH_CASE'], options['MATCH_WHOLE_WORD'], options['REGEX_SEARCH'])
 
-	def smart_highlighting_action(self, doc, search_pattern, iter, clear_flg = True):
-		regex = self.create_regex(search_pattern, self.options)
-		if clear_flg == True:
-			self.smart_highlight_off(doc)
-		
-		self.vadj_value = self._window.get_active_view().get_vadjustment().get_value()
-		current_line = iter.get_line()
-		start_line = current_line - 50
-		end_line = current_line + 50
-		if start_line <= 0:
-			self.start_iter = doc.get_start_iter()
-		else:
-			self.start_iter = doc.get_iter_at_line(start_line)
-		if end_line < doc.get_line_count():
-			self.end_iter = doc.get_iter_at_line(end_line)
+	def get_viewport_lines(self, view):
+		#Visible line range of the view, widened by VIEWPORT_MARGIN.
+		doc = view.get_buffer()
+		rect = view.get_visible_rect()
+		top = view.get_line_at_y(rect.y)[0].get_line()
+		bottom = view.get_line_at_y(rect.y + rect.height)[0].get_line()
+		return max(0, top - VIEWPORT_MARGIN), min(doc.get_line_count(), bottom + VIEWPORT_MARGIN + 1)
+
+	def status(self, msg):
+		statusbar = self._window.get_statusbar()
+		statusbar_ctxtid = statusbar.get_context_id('SmartHighlight')
+		statusbar.pop(statusbar_ctxtid)
+		if len(msg) > 0:
+			statusbar.push(statusbar_ctxtid, msg)
+
+	def update_status(self, state, index = None):
+		#Only the active document talks to the status bar.
+		if state.doc != self._window.get_active_document():
+			return
+		if not state.is_indexed():
+			self.status('')
+		elif index == None:
+			self.status(_("%d occurrences") % len(state.occurrence_starts))
 		else:
-			self.end_iter = doc.get_end_iter()
-			
-		text = str(doc.get_text(self.start_iter, self.end_iter, True))
-		
-		match = regex.search(text)
-		while(match):
-			self.smart_highlight_on(doc, match.start()+self.start_iter.get_offset(), match.end() - match.start())
-			match = regex.search(text, match.end()+1)
-			
+			self.status(_("%d of %d occurrences") % (index + 1, len(state.occurrence_starts)))
+
+	def goto_occurrence(self, forward):
+		state = self.doc_states.get(self._window.get_active_document())
+		if state == None:
+			return
+		index = state.goto_occurrence(self._window.get_active_view(), forward)
+		if index != None:
+			self.update_status(state, index)
+
+	def on_next_occurrence(self, action, data = None):
+		self.goto_occurrence(True)
+
+	def on_previous_occurrence(self, action, data = None):
+		self.goto_occurrence(False)
+
+	@profiled
 	def tab_added_action(self, action, tab):
 		view = tab.get_view()
-		view.get_buffer().connect('mark-set', self.on_textbuffer_markset_event)
-		view.get_vadjustment().connect('value-changed', self.on_view_vadjustment_value_changed)
+		doc = tab.get_document()
+		self.doc_states[doc] = DocumentHighlightState(self, doc)
+		self.handlers.connect(tab, doc, 'mark-set', self.on_textbuffer_markset_event)
+		self.handlers.connect(tab, doc, 'changed', self.on_textbuffer_changed_event)
+		self.handlers.connect(tab, view.get_vadjustment(), 'value-changed', self.on_view_vadjustment_value_changed, view)
 		#view.connect('button-press-event', self.on_view_button_press_event)
-	
+
+	def tab_removed_action(self, action, tab):
+		self.handlers.disconnect(tab)
+		state = self.doc_states.pop(tab.get_document(), None)
+		if state != None:
+			state.destroy()
+
+	@profiled
+	def active_tab_changed_action(self, action, tab):
+		state = self.doc_states.get(tab.get_document())
+		if state != None:
+			self.update_status(state)
+
+	@profiled
 	def on_textbuffer_markset_event(self, textbuffer, iter, textmark):
 		#print textmark.get_name()
 		if textmark.get_name() != 'selection_bound' and textmark.get_name() != 'insert':
 			return
-		if textbuffer.get_selection_bounds():
-			start, end = textbuffer.get_selection_bounds()
-			self.current_selection = textbuffer.get_text(start, end, True)
-			self.smart_highlighting_action(textbuffer, self.current_selection, iter)
-		else:
- 			self.current_selection = ''
- 			self.smart_highlight_off(textbuffer)
-	
-	def smart_highlight_on(self, doc, highlight_start, highlight_len):
-		if doc.get_tag_table().lookup('smart_highlight') == None:
-			tag = doc.create_tag("smart_highlight", foreground=self.smart_highlight['FOREGROUND_COLOR'], background=self.smart_highlight['BACKGROUND_COLOR'])
-		doc.apply_tag_by_name('smart_highlight', doc.get_iter_at_offset(highlight_start), doc.get_iter_at_offset(highlight_start + highlight_len))
-		
-	def smart_highlight_off(self, doc):
-		start, end = doc.get_bounds()
-		if doc.get_tag_table().lookup('smart_highlight') == None:
-			tag = doc.create_tag("smart_highlight", foreground=self.smart_highlight['FOREGROUND_COLOR'], background=self.smart_highlight['BACKGROUND_COLOR'])
-		doc.remove_tag_by_name('smart_highlight', start, end)
-		
+		state = self.doc_states.get(textbuffer)
+		if state != None:
+			state.schedule_highlight()
+
+	@profiled
+	def on_textbuffer_changed_event(self, textbuffer):
+		state = self.doc_states.get(textbuffer)
+		if state != None:
+			state.on_changed()
+
 	def smart_highlight_configure(self, action, data = None):
 		config_ui = ConfigUI(self._plugin)
 		
-	def on_view_vadjustment_value_changed(self, object, data = None):
-		if self.current_selection == '':
+	@profiled
+	def on_view_vadjustment_value_changed(self, object, view):
+		state = self.doc_states.get(view.get_buffer())
+		if state == None or state.selection == '':
 			return
-		if object.get_value() < self.vadj_value:	#scroll up
-			self.smart_highlighting_action(self._window.get_active_document(), self.current_selection, self.start_iter, False)
-		else:	#scroll down
-			self.smart_highlighting_action(self._window.get_active_document(), self.current_selection, self.end_iter, False)
+		#Newly exposed lines only, the ones already tagged are skipped.
+		state.highlight_viewport(view)
 
 			
 
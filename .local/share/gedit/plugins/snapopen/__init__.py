@@ -2,6 +2,8 @@ from gi.repository import GObject, Gedit, Gtk, Gio, Gdk
 import os, os.path
 from urllib.request import pathname2url
 import tempfile
+import shutil
+from hackslib import projectroots, workers, profiler, search
 
 max_result = 50
 app_string = "Snap open"
@@ -9,6 +11,17 @@ app_string = "Snap open"
 def send_message(window, object_path, method, **kwargs):
     return window.get_message_bus().send_sync(object_path, method, **kwargs)
 
+def refresh_file_list( index, listfile, cmd, job = None ):
+    """ On a worker: start from the prewarmed index if there is no list yet, then run find """
+    if index is not None and not os.path.exists(listfile):
+        try:
+            shutil.copyfile(index, listfile)
+        except OSError:
+            pass
+    if job is not None and job.cancelled:
+        return []
+    return search.run_lines(cmd, job)
+
 ui_str="""<ui>
 <menubar name="MenuBar">
     <menu name="FileMenu" action="File">
@@ -29,16 +42,19 @@ class SnapOpenPluginInstance:
         self._tmpfile = os.path.join(tempfile.gettempdir(), 'snapopen.%s.%s' % (os.getuid(),os.getpid()))
         self._show_hidden = False
         self._liststore = None;
+        self._find_job = None
         self._init_ui()
         self._insert_menu()
 
     def deactivate( self ):
+        if self._find_job is not None:
+            self._find_job.cancel()
         self._remove_menu()
         self._action_group = None
         self._window = None
         self._plugin = None
         self._liststore = None;
-        os.popen('rm %s &> /dev/null' % (self._tmpfile))
+        os.popen('rm %s %s.new &> /dev/null' % (self._tmpfile, self._tmpfile))
 
     def update_ui( self ):
         return
@@ -107,6 +123,7 @@ class SnapOpenPluginInstance:
         self.open_selected_item(event)
 
     #keyboard event on entry field
+    @profiler.profiled
     def on_pattern_entry( self, widget, event ):
         oldtitle = self._snapopen_window.get_title().replace(" * too many hits", "")
 
@@ -114,13 +131,12 @@ class SnapOpenPluginInstance:
             self.open_selected_item( event )
             return
         pattern = self._glade_entry_name.get_text()
-        pattern = pattern.replace(" ",".*")
         cmd = ""
         if self._show_hidden:
             filefilter = ""
         if len(pattern) > 0:
             # To search by name
-            cmd = "grep -i -m %d -e '%s' %s 2> /dev/null" % (max_result, pattern, self._tmpfile)
+            cmd = search.fuzzy_command(pattern, self._tmpfile, max_result)
             self._snapopen_window.set_title("Searching ... ")
         else:
             self._snapopen_window.set_title("Enter pattern ... ")
@@ -149,58 +165,15 @@ class SnapOpenPluginInstance:
             if iter != None:
                 self._hit_list.get_selection().select_iter(iter)
 
-    def get_git_base_dir( self, path ):
-        """ Get git base dir if given path is inside a git repo. None otherwise. """
-        try:
-            cmd = "cd '%s' 2> /dev/null; git rev-parse --show-toplevel 2> /dev/null" % path
-            print(cmd)
-            gitdir = os.popen(cmd).readlines()
-        except:
-            gitdir = ''
-        if len(gitdir) > 0:
-            return gitdir[0].replace("\n","")
+    def get_prewarmed_index( self ):
+        """ File list built by Fastprojects when the project was opened, if any """
+        if len(self._dirs) != 1:
+            return None
+        index = projectroots.project_index_file(self._dirs[0])
+        if os.path.exists(index):
+            return index
         return None
 
-    def map_to_git_base_dirs( self ):
-        """ Replace paths with respective git repo base dirs if it exists """
-        # use git repo base dir is more suitable if we are inside a git repo, for any dir we have guessed before
-        dirs = []
-        for d in self._dirs:
-            gitdir = self.get_git_base_dir(d)
-            if gitdir is None:
-                dirs.append(d)
-            else:
-                dirs.append(gitdir)
-        self._dirs = dirs
-        # we could have introduced duplicates here
-        self.ensure_unique_entries()
-
-    def ensure_unique_entries( self ):
-        """ Remove duplicates from dirs list """
-        # this also looks for paths already included in other paths
-        unique = []
-        for d in self._dirs:
-            d = d.replace("file://","").replace("//","/")
-            should_append = True
-            for i,u in enumerate(unique): # replace everyone with its wider parent
-                if u in d: # already this one, or a parent
-                    should_append = False
-                elif d in u: # replace with the parent
-                    unique[i] = d
-                    should_append = False
-
-            if should_append:
-                unique.append(d)
-
-        self._dirs = set(unique)
-
-    def get_dirs_string( self ):
-        """ Gets the quoted string built with dir list, ready to be passed on to 'find' """
-        string = ''
-        for d in self._dirs:
-            string += "'%s' " % d
-        return string
-
     #on menuitem activation (incl. shortcut)
     def on_snapopen_action( self ):
         self._init_ui()
@@ -219,28 +192,24 @@ class SnapOpenPluginInstance:
         if fbroot != "" and fbroot is not None:
             self._dirs.append(fbroot)
 
-        # ensure_unique_entries is executed after mapping to git base dir
-        # but it's cheaper, then do it before too, avoiding extra work
-        self.ensure_unique_entries()
-
-        # replace each path with its git base dir if exists
-        self.map_to_git_base_dirs()
+        # replace each path with its git base dir if exists, without duplicates
+        self._dirs = projectroots.map_to_git_base_dirs(self._dirs)
 
         # append gedit dir (usually too wide for a quick search) if we have nothing so far
         if len(self._dirs) == 0:
             self._dirs = [ os.getcwd() ]
 
-        # build filters list
-        #modify lines below as needed, these defaults work pretty well
-        filters = " ! -iname '*.jpg' ! -iname '*.jpeg' ! -iname '*.gif' ! -iname '*.png' ! -iname '*.psd' ! -iname '*.tif' "
-        filters += " ! -path '*.svn*' ! -path '*.git*' "
-        filters += " ! -iname '*.o' ! -iname '*.so' ! -iname '*.lo' ! -iname '*.Plo' ! -iname '*.a' ! -iname '*.pyc' "
-        filters += " ! -iname '*~' ! -iname '*.swp' "
-
-        # cache the file list in the background
-        cmd = "find %s -type f %s > %s 2> /dev/null &" % (self.get_dirs_string(), filters, self._tmpfile)
+        # cache the file list in the background, replacing the old one only when complete
+        # filters live in hackslib.search, modify them as needed
+        cmd = search.find_command(self._dirs, self._tmpfile)
         print(cmd)
-        os.popen(cmd)
+        # a find still running for the previous dirs is useless now
+        if self._find_job is not None:
+            self._find_job.cancel()
+        # the user is waiting on this list, it must not queue behind indexing.
+        # A first list comes from the prewarmed index, if any, until find is done
+        self._find_job = workers.get_pool().submit(refresh_file_list, self.get_prewarmed_index(),
+                                                   self._tmpfile, cmd, priority=workers.INTERACTIVE)
 
         self._snapopen_window.show()
         self._glade_entry_name.select_region(0,-1)
@@ -302,6 +271,7 @@ class SnapOpenPlugin(GObject.Object, Gedit.WindowActivatable):
     def _set_instance( self, instance ):
         self.window.DATA_TAG = instance
 
+    @profiler.profiled
     def do_activate( self ):
         self._set_instance( SnapOpenPluginInstance( self, self.window ) )
 
@@ -7,35 +7,266 @@ Strip trailing whitespace before saving.
 
 """
 
-from gi.repository import GObject, Gedit
+import bisect
+import logging
+import os
+import re
+import time
+
+from gi.repository import GObject, Gedit, GLib
+
+try:
+    from hackslib.profiler import profiled
+except ImportError:
+    # this plugin also ships on its own, profiling comes with hackslib
+    def profiled(func):
+        return func
+
+# Documents bigger than this (in characters) never get a full strip
+MAX_FULL_STRIP_CHARS = 4 * 1024 * 1024
+# What to do above MAX_FULL_STRIP_CHARS: "dirty" strips the lines edited
+# since the last save when they are known, "skip" strips nothing
+LARGE_DOCUMENT_POLICY = "dirty"
+# Show the cost of each strip in the status bar
+SHOW_STATS = bool(os.environ.get("WHITESPACE_TERMINATOR_STATS"))
+STATS_TIMEOUT = 5  # seconds
+
+logger = logging.getLogger(__name__)
+
+# Whitespace (but not the newline) at the end of each line
+TRAILING_WHITESPACE = re.compile(r"[^\S\n]+$", re.MULTILINE)
+
+
+def trailing_whitespace_ranges(text, strip_end=True):
+    """Return the sorted ``(start, end)`` offsets to delete from ``text``.
+
+    Trailing whitespace of every line is found in one regex pass. If
+    ``strip_end`` is true, the whitespace and empty lines at the end of the
+    text form the last range.
+
+    """
+    if not strip_end:
+        return [match.span() for match in TRAILING_WHITESPACE.finditer(text)]
+    end = len(text.rstrip())
+    ranges = [
+        match.span() for match in TRAILING_WHITESPACE.finditer(text, 0, end)]
+    if end < len(text):
+        ranges.append((end, len(text)))
+    return ranges
+
+
+def document_end_range(document):
+    """Return the offsets of the whitespace at the end of ``document``."""
+    start = document.get_end_iter()
+    end = start.get_offset()
+    while start.backward_char():
+        if not start.get_char().isspace():
+            start.forward_char()
+            break
+    return start.get_offset(), end
+
+
+def count_lines(document, lines):
+    """Return the number of existing lines in ``lines``."""
+    line_count = document.get_line_count()
+    return sum(
+        max(0, min(last, line_count) - first) for first, last in lines)
+
+
+def dirty_ranges(document, lines):
+    """Return the offsets to strip in the ``lines`` of ``document``."""
+    ranges = []
+    line_count = document.get_line_count()
+    for first, last in lines:
+        if first >= line_count:
+            break
+        start = document.get_iter_at_line(first)
+        if last < line_count:
+            end = document.get_iter_at_line(last)
+        else:
+            end = document.get_end_iter()
+        offset = start.get_offset()
+        ranges.extend(
+            (offset + range_start, offset + range_end) for range_start, range_end
+            in trailing_whitespace_ranges(
+                document.get_slice(start, end, True), strip_end=False))
+    if lines and lines[-1][1] >= line_count:
+        # The end of the document has been edited, strip its empty lines
+        end_start, end_end = document_end_range(document)
+        ranges = [
+            (start, min(end, end_start)) for start, end in ranges
+            if start < end_start]
+        if end_start < end_end:
+            ranges.append((end_start, end_end))
+    return ranges
+
+
+class DirtyLines(object):
+    """Sorted and disjoint ``(first, last)`` line ranges edited since save.
+
+    Ranges are half-open and follow the insertions and deletions of lines,
+    so that they still point to the edited lines when the document is saved.
+
+    """
+    def __init__(self):
+        self.ranges = []
+
+    def clear(self):
+        self.ranges = []
+
+    def _after(self, line):
+        """Index of the first range ending after ``line``."""
+        index = bisect.bisect_right(self.ranges, (line, float('inf')))
+        if index and self.ranges[index - 1][1] > line:
+            index -= 1
+        return index
+
+    def add(self, first, last):
+        # Only the ranges touching (first, last) are merged and replaced
+        low = self._after(first - 1)
+        high = bisect.bisect_right(self.ranges, (last, float('inf')))
+        if low < high:
+            first = min(first, self.ranges[low][0])
+            last = max(last, self.ranges[high - 1][1])
+        self.ranges[low:high] = [(first, last)]
+
+    def insert(self, line, new_lines):
+        """Text with ``new_lines`` line breaks is inserted at ``line``."""
+        if new_lines:
+            index = self._after(line)
+            self.ranges[index:] = [
+                (start + new_lines if start > line else start, end + new_lines)
+                for start, end in self.ranges[index:]]
+        self.add(line, line + new_lines + 1)
+
+    def delete(self, first, last):
+        """Text is deleted from ``first`` line to ``last`` line."""
+        removed = last - first
+        if removed:
+            def shift(line):
+                if line > last:
+                    return line - removed
+                return min(line, first)
+            # Ranges ending before the deleted lines do not move
+            index = self._after(first + 1)
+            self.ranges[index:] = [
+                (shift(start), max(shift(end - 1) + 1, shift(start) + 1))
+                for start, end in self.ranges[index:]]
+        self.add(first, first + 1)
+
+
+def strip_ranges(document, ranges):
+    """Delete ``ranges`` from ``document`` as a single undoable action."""
+    if not ranges:
+        return
+    document.begin_user_action()
+    try:
+        # Back to front, so that the offsets of the next ranges stay valid
+        for start, end in reversed(ranges):
+            document.delete(
+                document.get_iter_at_offset(start),
+                document.get_iter_at_offset(end))
+    finally:
+        document.end_user_action()
 
 
 class WhiteSpaceTerminator(GObject.Object, Gedit.WindowActivatable):
     """Strip trailing whitespace before saving."""
     window = GObject.property(type=Gedit.Window)
 
+    @profiled
     def do_activate(self):
-        self.handlers = []
-        handler = self.window.connect("tab-added", self.on_tab_added)
-        self.handlers.append((self.window, handler))
+        self.handlers = [
+            self.window.connect("tab-added", self.on_tab_added),
+            self.window.connect("tab-removed", self.on_tab_removed)]
+        # Handler ids per document, so that each one is connected only once
+        self.document_handlers = {}
+        # Edited lines per document, None when edits are unknown
+        self.dirty_lines = {}
         for document in self.window.get_documents():
-            document.connect("save", self.on_document_save)
-            self.handlers.append((document, handler))
+            self.connect_document(document)
 
+    @profiled
     def on_tab_added(self, window, tab, data=None):
-        handler = tab.get_document().connect("save", self.on_document_save)
-        self.handlers.append((tab, handler))
+        self.connect_document(tab.get_document())
+
+    def on_tab_removed(self, window, tab, data=None):
+        self.disconnect_document(tab.get_document())
+
+    def connect_document(self, document):
+        """Strip ``document`` on save, and record its edits until then."""
+        if document in self.document_handlers:
+            return
+        # Edits made before we were there are unknown, strip everything
+        self.dirty_lines[document] = (
+            None if document.get_modified() else DirtyLines())
+        self.document_handlers[document] = [
+            document.connect(signal, callback) for signal, callback in (
+                ("save", self.on_document_save),
+                ("insert-text", self.on_insert_text),
+                ("delete-range", self.on_delete_range),
+                ("loaded", self.on_document_clean),
+                ("saved", self.on_document_clean))]
+
+    def disconnect_document(self, document):
+        for handler in self.document_handlers.pop(document, []):
+            document.disconnect(handler)
+        self.dirty_lines.pop(document, None)
 
+    @profiled
+    def on_insert_text(self, document, location, text, length, data=None):
+        dirty_lines = self.dirty_lines.get(document)
+        if dirty_lines is not None:
+            dirty_lines.insert(location.get_line(), text.count("\n"))
+
+    @profiled
+    def on_delete_range(self, document, start, end, data=None):
+        dirty_lines = self.dirty_lines.get(document)
+        if dirty_lines is not None:
+            dirty_lines.delete(start.get_line(), end.get_line())
+
+    def on_document_clean(self, document, *args):
+        # Older gedit versions pass an error, keep the edits if there is one
+        if args and args[0] is not None:
+            return
+        self.dirty_lines[document] = DirtyLines()
+
+    @profiled
     def on_document_save(self, document, location, encoding, compression,
                          flags, data=None):
-        for i, text in enumerate(document.props.text.rstrip().splitlines()):
-            strip_stop = document.get_iter_at_line(i)
-            strip_stop.forward_to_line_end()
-            strip_start = strip_stop.copy()
-            strip_start.backward_chars(len(text) - len(text.rstrip()))
-            document.delete(strip_start, strip_stop)
-        document.delete(strip_start, document.get_end_iter())
+        start_time = time.perf_counter()
+        dirty_lines = self.dirty_lines.get(document)
+        large = document.get_char_count() > MAX_FULL_STRIP_CHARS
+        if large and (dirty_lines is None or LARGE_DOCUMENT_POLICY == "skip"):
+            mode, scanned, ranges = "skipped", 0, []
+        elif dirty_lines is None:
+            mode, scanned = "full", document.get_line_count()
+            ranges = trailing_whitespace_ranges(document.props.text)
+        else:
+            mode = "dirty"
+            scanned = count_lines(document, dirty_lines.ranges)
+            ranges = dirty_ranges(document, dirty_lines.ranges)
+        strip_ranges(document, ranges)
+        self.report_stats(
+            document, mode, scanned, len(ranges),
+            (time.perf_counter() - start_time) * 1000)
+
+    def report_stats(self, document, mode, scanned, changed, elapsed):
+        """Log the cost of a strip, and show it if ``SHOW_STATS`` is set."""
+        message = (
+            "Whitespace strip (%s): %d lines scanned, %d changed, %.1f ms" % (
+                mode, scanned, changed, elapsed))
+        logger.debug("%s: %s", document.get_short_name_for_display(), message)
+        if not SHOW_STATS:
+            return
+        statusbar = self.window.get_statusbar()
+        context_id = statusbar.get_context_id("WhiteSpaceTerminator")
+        message_id = statusbar.push(context_id, message)
+        GLib.timeout_add_seconds(
+            STATS_TIMEOUT, statusbar.remove, context_id, message_id)
 
     def do_deactivate(self):
-        for obj, handler in self.handlers:
-            obj.disconnect(handler)
+        for handler in self.handlers:
+            self.window.disconnect(handler)
+        for document in list(self.document_handlers):
+            self.disconnect_document(document)
@@ -0,0 +1,90 @@
+# -*- coding: utf8 -*-
+#  Benchmarks for the gedit hacks plugins
+#
+#  Copyright (C) 2012-2013 Rubén Caro
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Listing, fuzzy matching, grep and project discovery benchmarks.
+
+Every bench_* function gets a benchmark callable, in the pytest-benchmark
+way, and the root of a synthetic tree. Whatever it passes to benchmark() is
+what gets timed. """
+
+import os, os.path
+import tempfile
+from hackslib import projectroots, search, query
+import synthetic
+
+max_result = 1000
+
+def bench_listing_walk( benchmark, root ):
+    """ In-process listing, as the prewarm does it """
+    benchmark(lambda: sum(1 for _ in search.list_files(root)))
+
+def bench_listing_find( benchmark, root ):
+    """ SnapOpen's find into its list file """
+    with tempfile.TemporaryDirectory() as tmp:
+        benchmark(search.run_lines, search.find_command([root], os.path.join(tmp, 'list')))
+
+def bench_fuzzy_match( benchmark, root ):
+    """ SnapOpen's grep over the list file for a two word query """
+    with tempfile.TemporaryDirectory() as tmp:
+        listfile = os.path.join(tmp, 'list')
+        search.run_lines(search.find_command([root], listfile))
+        benchmark(search.run_lines, search.fuzzy_command('pkg 42 py', listfile, max_result))
+
+def bench_grep_literal( benchmark, root ):
+    """ Grepint project search for an identifier """
+    plan = query.plan_query(synthetic.needle)
+    benchmark(search.grep_paths, plan, [root], max_result)
+
+def bench_grep_regex( benchmark, root ):
+    """ Grepint project search for a query with spaces """
+    plan = query.plan_query('value ' + synthetic.needle)
+    benchmark(search.grep_paths, plan, [root], max_result)
+
+def bench_grep_regex_unfiltered( benchmark, root ):
+    """ grep with a regex without a required literal """
+    plan = query.plan_query('needle_token|NEEDLE_TOKEN', query.REGEX)
+    benchmark(search.grep_paths, plan, [root], max_result)
+
+def bench_grep_file( benchmark, root ):
+    """ grep on a single file, as Grepint did for the current document """
+    plan = query.plan_query(synthetic.needle)
+    benchmark(search.grep_paths, plan, [synthetic.file_path(root, 0)], max_result)
+
+def bench_project_discovery( benchmark, root ):
+    """ Fastprojects' walk for .git dirs """
+    benchmark(lambda: list(projectroots.find_projects(root)))
+
+def bench_search_literal( benchmark, root ):
+    """ Grepint's in-process search for an identifier, substring fast path """
+    plan = query.plan_query(synthetic.needle)
+    benchmark(search.search_paths, plan, [root], max_result)
+
+def bench_search_regex( benchmark, root ):
+    """ Grepint's in-process search for a query with spaces, prefiltered by its longest word """
+    plan = query.plan_query('value ' + synthetic.needle)
+    benchmark(search.search_paths, plan, [root], max_result)
+
+def bench_search_regex_unfiltered( benchmark, root ):
+    """ A regex without a required literal, every line goes through the regex engine """
+    plan = query.plan_query('needle_token|NEEDLE_TOKEN', query.REGEX)
+    benchmark(search.search_paths, plan, [root], max_result)
+
+def bench_search_file( benchmark, root ):
+    """ Grepint's in-process search of the current document """
+    plan = query.plan_query(synthetic.needle)
+    benchmark(search.search_paths, plan, [synthetic.file_path(root, 0)], max_result)
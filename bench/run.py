@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf8 -*-
+#  Benchmarks for the gedit hacks plugins
+#
+#  Copyright (C) 2012-2013 Rubén Caro
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Runs the search and indexing benchmarks without gedit.
+
+    python3 bench/run.py                       # 1k and 10k files
+    python3 bench/run.py --sizes 100k,1m -k grep
+    python3 bench/run.py --json results.json
+
+Trees are generated once under --dir (1m files takes a while and a few GB).
+Each benchmark runs in its own python process, so its peak RSS is its own;
+'child KiB' is the biggest of the processes it spawned (find, grep...), which
+never reads below the size of the forked python they start from.
+"""
+
+import os, os.path
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+here = os.path.dirname(os.path.abspath(__file__))
+plugins = os.path.join(os.path.dirname(here), '.local', 'share', 'gedit', 'plugins')
+sys.path[:0] = [here, plugins]
+
+import synthetic
+import bench_engines
+
+class Benchmark:
+    """ Callable timing a function like pytest-benchmark's fixture does """
+
+    def __init__( self, rounds, warmup = 1 ):
+        self.rounds = rounds
+        self.warmup = warmup
+        self.timings = []
+
+    def __call__( self, func, *args, **kwargs ):
+        for _ in range(self.warmup):
+            result = func(*args, **kwargs)
+        for _ in range(self.rounds):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            self.timings.append(time.perf_counter() - start)
+        return result
+
+def benchmarks( keyword = None ):
+    """ bench_* functions by name, filtered by keyword """
+    names = sorted(n for n in dir(bench_engines) if n.startswith('bench_'))
+    return [n for n in names if keyword is None or keyword in n]
+
+def run_one( name, root, rounds ):
+    """ Run a benchmark in this process, returning its stats """
+    benchmark = Benchmark(rounds)
+    getattr(bench_engines, name)(benchmark, root)
+    timings = benchmark.timings
+    # ru_maxrss is in KiB on linux
+    return { 'min': min(timings),
+             'mean': sum(timings) / len(timings),
+             'max': max(timings),
+             'rounds': len(timings),
+             'rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+             'child_rss_kib': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss }
+
+def run_isolated( name, root, rounds ):
+    """ Run a benchmark in a fresh interpreter """
+    out = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                   '--child', name, '--root', root, '--rounds', str(rounds)])
+    return json.loads(out.decode('utf-8'))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1k,10k', help='tree sizes, e.g. 1k,10k,100k,1m')
+    parser.add_argument('--dir', default=os.path.join(tempfile.gettempdir(), 'gedit-hacks-bench'),
+                        help='where synthetic trees are kept')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('-k', dest='keyword', help='only benchmarks whose name contains this')
+    parser.add_argument('--json', help='also write results to this file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--root', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_one(args.child, args.root, args.rounds)))
+        return
+
+    results = []
+    print('%-26s %6s %10s %10s %10s %7s %10s %10s' % (
+        'benchmark', 'files', 'min ms', 'mean ms', 'max ms', 'rounds', 'RSS KiB', 'child KiB'))
+    for label in args.sizes.split(','):
+        files = synthetic.parse_size(label)
+        root = synthetic.ensure_tree(args.dir, files)
+        for name in benchmarks(args.keyword):
+            stats = run_isolated(name, root, args.rounds)
+            stats.update(name=name, files=files)
+            results.append(stats)
+            print('%-26s %6s %10.1f %10.1f %10.1f %7d %10d %10d' % (
+                name[len('bench_'):], synthetic.size_label(files), stats['min'] * 1000,
+                stats['mean'] * 1000, stats['max'] * 1000, stats['rounds'],
+                stats['rss_kib'], stats['child_rss_kib']))
+            sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf8 -*-
+#  Benchmarks for the gedit hacks plugins
+#
+#  Copyright (C) 2012-2013 Rubén Caro
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Synthetic source trees to benchmark against.
+
+A tree of N files is made of git projects of files_per_project files each,
+spread in dirs of files_per_dir files. Contents are deterministic: the same
+N always gives the same tree, so results can be compared between runs. """
+
+import os, os.path
+import random
+
+files_per_project = 1000
+files_per_dir = 50
+lines_per_file = 20
+# one file in this many holds the needle token, one in binary_every is binary
+needle = 'needle_token'
+needle_every = 100
+binary_every = 500
+latin1_every = 250
+
+words = ('def class return import self value index buffer window search '
+         'result project path line text match pattern cache item list').split()
+exts = ['.py', '.c', '.txt', '.rb', '.js']
+
+def size_label( files ):
+    """ 1000 -> '1k', 1000000 -> '1m' """
+    if files % 1000000 == 0:
+        return '%dm' % (files // 1000000)
+    if files % 1000 == 0:
+        return '%dk' % (files // 1000)
+    return str(files)
+
+def parse_size( label ):
+    """ '10k' -> 10000 """
+    label = label.strip().lower()
+    factor = {'k': 1000, 'm': 1000000}.get(label[-1:], 1)
+    return int(label.rstrip('km')) * factor
+
+def file_content( i ):
+    """ Bytes of the i-th file """
+    rnd = random.Random(i)
+    if i % binary_every == binary_every - 1:
+        return bytes(rnd.randrange(256) for _ in range(2048)) + b'\0' + needle.encode()
+    lines = []
+    for n in range(lines_per_file):
+        lines.append(' '.join(rnd.choice(words) for _ in range(8)))
+    if i % needle_every == 0:
+        lines[rnd.randrange(lines_per_file)] += ' ' + needle
+    text = '\n'.join(lines) + '\n'
+    if i % latin1_every == 1:
+        return ('# café %s\n' % needle).encode('latin-1') + text.encode('latin-1')
+    return text.encode('utf-8')
+
+def file_path( root, i ):
+    project = i // files_per_project
+    folder = (i % files_per_project) // files_per_dir
+    name = 'module_%d%s' % (i, exts[i % len(exts)])
+    return os.path.join(root, 'project-%04d' % project, 'pkg-%02d' % folder, name)
+
+def make_git_dir( project ):
+    gitdir = os.path.join(project, '.git')
+    os.makedirs(os.path.join(gitdir, 'refs', 'heads'), exist_ok=True)
+    with open(os.path.join(gitdir, 'HEAD'), 'w') as f:
+        f.write('ref: refs/heads/master\n')
+
+def ensure_tree( base, files ):
+    """ Path to a tree of given number of files under base, created once """
+    root = os.path.join(base, 'tree-%s' % size_label(files))
+    done = os.path.join(root, '.complete')
+    if os.path.exists(done):
+        return root
+    for i in range(files):
+        path = file_path(root, i)
+        if i % files_per_dir == 0:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if i % files_per_project == 0:
+            make_git_dir(os.path.dirname(os.path.dirname(path)))
+        with open(path, 'wb') as f:
+            f.write(file_content(i))
+    open(done, 'w').close()
+    return root
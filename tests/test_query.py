@@ -0,0 +1,97 @@
+# -*- coding: utf8 -*-
+""" Query planning is pure logic, these run without gedit """
+
+import os, os.path
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                '.local', 'share', 'gedit', 'plugins'))
+
+import pytest
+from hackslib import query, search
+
+@pytest.mark.parametrize('pattern, literal', [
+    ('foo.*barbaz', 'barbaz'),
+    ('ab+c', 'ab'),
+    ('colou?r', 'colo'),
+    ('(x|y)hello', 'hello'),
+    ('a|b', ''),
+    ('[abc]defg', 'defg'),
+    ('[]a]bcd', 'bcd'),
+    ('x{2,3}yz', 'yz'),
+    ('\\.method\\(', '.method('),
+    ('\\bword\\b', 'word'),
+    ('\\x41BC', 'BC'),
+    ('\\u0041BC', 'BC'),
+    ('\\U00000041BC', 'BC'),
+    ('\\N{LATIN CAPITAL LETTER A}BC', 'BC'),
+    ('\\101BC', 'BC'),
+    ('\\0BC', 'BC'),
+    ('\\01BC', 'BC'),
+    ('(ab)\\1cd', 'cd'),
+    ('(ab)\\12', ''),
+])
+def test_longest_literal( pattern, literal ):
+    assert query.longest_literal(pattern) == literal
+
+def matches( text, q, mode = query.AUTO ):
+    plan = query.plan_query(q, mode)
+    return [n for n, start, end in search.matching_lines(text, plan, 100)]
+
+def test_escapes_still_find_their_match():
+    assert matches(b'xx ABC yy', '\\x41BC', query.REGEX) == [1]
+    assert matches(b'xx ABC yy', '\\101BC', query.REGEX) == [1]
+
+@pytest.mark.parametrize('q', ['foo(', 'a[0', '*ptr', 'f(x))'])
+def test_auto_takes_invalid_regexes_literally( q ):
+    plan = query.plan_query(q)
+    assert plan.mode == query.LITERAL
+    assert plan.regex is None
+
+def test_auto_keeps_valid_regexes():
+    assert query.plan_query('x+').mode == query.REGEX
+
+def test_explicit_regex_mode_raises_on_invalid_regex():
+    with pytest.raises(query.re.error):
+        query.plan_query('foo(', query.REGEX)
+
+def test_ignore_case_in_mapped_files( tmp_path ):
+    path = tmp_path / 'big.txt'
+    path.write_bytes(b'x\n' * search.mmap_min_size + b'a NEEDLE here\n')
+    plan = query.plan_query('needle')
+    with open(str(path), 'rb') as f, search.mmap.mmap(f.fileno(), 0, access=search.mmap.ACCESS_READ) as data:
+        assert [n for n, start, end in search.matching_lines(data, plan, 10)] == [search.mmap_min_size + 1]
+    assert matches(b'a NEEDLE here', 'needle') == [1]
+
+@pytest.mark.parametrize('q, mode, ignore_case', [
+    ('needle', query.AUTO, True), ('a needle', query.AUTO, True),
+    ('nee+dle', query.REGEX, True), ('needle', query.WORD, True),
+    ("it's (x", query.AUTO, True),
+    ('ñan+du', query.REGEX, True), ('ñ.*bar', query.REGEX, True),
+    ('ñandu', query.WORD, True), ('el ñandu', query.AUTO, True),
+    ('ñandu', query.LITERAL, True), ('ñ', query.LITERAL, True),
+    ('ñandu', query.LITERAL, False), ('ñan+du', query.REGEX, False),
+    ('el ñandu', query.AUTO, False)])
+def test_grep_finds_what_search_finds( tmp_path, q, mode, ignore_case ):
+    (tmp_path / 'utf8.txt').write_bytes(
+        "a NEEDLE ñ\nneedles\nit's (x\nel ÑANDU\nñandues\nel gran ñandu\nÑo bar\n".encode('utf-8'))
+    (tmp_path / 'latin1.txt').write_bytes("ñ\na needle ñ\nel ñandu\nEL ÑANDU\nñx bar\n".encode('latin-1'))
+    plan = query.plan_query(q, mode, ignore_case)
+    grepped = search.grep_paths(plan, [str(tmp_path)], 100)
+    assert grepped
+    assert sorted(grepped) == sorted(search.search_paths(plan, [str(tmp_path)], 100))
+
+@pytest.mark.parametrize('q, mode', [('ñandu', query.AUTO), ('ñandu', query.LITERAL),
+                                     ('ñandu', query.WORD), ('ñan+du', query.REGEX),
+                                     ('el ñandu', query.AUTO), ('ñ', query.LITERAL)])
+def test_ignore_case_folds_non_ascii( q, mode ):
+    assert matches('x\nEL ÑANDU\ny'.encode('utf-8'), q, mode) == [2]
+
+def test_non_ascii_in_latin1_files():
+    plan = query.plan_query('ñandu').for_encoding('latin-1')
+    assert [n for n, start, end in search.matching_lines('ÑANDU'.encode('latin-1'), plan, 10)] == [1]
+
+def test_non_ascii_case_kept_when_asked():
+    assert matches('ÑANDU\nñandu'.encode('utf-8'), 'ñandu', query.LITERAL) == [1, 2]
+    plan = query.plan_query('ñandu', query.LITERAL, ignore_case=False)
+    assert [n for n, start, end in search.matching_lines('ÑANDU\nñandu'.encode('utf-8'), plan, 10)] == [2]
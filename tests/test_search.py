@@ -0,0 +1,35 @@
+# -*- coding: utf8 -*-
+""" File listing, these run without gedit """
+
+import os, os.path
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                '.local', 'share', 'gedit', 'plugins'))
+
+from hackslib import search
+
+def test_list_files_lists_what_find_does( tmp_path ):
+    tree = tmp_path / 'tree'
+    (tree / 'pkg' / '.git').mkdir(parents=True)
+    (tree / 'pkg' / '.git' / 'config').write_text('x')
+    (tree / 'pkg' / 'main.py').write_text('x')
+    (tree / 'pkg' / 'main.pyc').write_text('x')
+    (tree / 'notes.txt~').write_text('x')
+    (tree / 'link.txt').symlink_to(tree / 'pkg' / 'main.py')
+    (tree / 'broken.txt').symlink_to(tree / 'missing')
+    (tree / 'linked-pkg').symlink_to(tree / 'pkg')
+    os.mkfifo(str(tree / 'fifo'))
+    listfile = str(tmp_path / 'list')
+    search.run_lines(search.find_command([str(tree)], listfile))
+    with open(listfile) as f:
+        found = sorted(line.rstrip('\n') for line in f)
+    assert found == sorted(search.list_files(str(tree)))
+    assert found == [str(tree / 'link.txt'), str(tree / 'pkg' / 'main.py')]
+
+def test_fuzzy_command_quotes_the_query( tmp_path ):
+    listfile = tmp_path / 'list'
+    listfile.write_text("/src/it's here.py\n/src/other.py\n")
+    hits = search.run_lines(search.fuzzy_command("it's here", str(listfile), 10))
+    assert hits == ["/src/it's here.py\n"]
+    assert search.run_lines(search.fuzzy_command("'; echo injected; '", str(listfile), 10)) == []